@@ -21,23 +21,33 @@
 
 __all__ = ("APP_ID", "IS_WIN", "IS_LINUX", "IS_DARWIN", "IS_FROZEN", "APP", "UI_PATH", "MOD_MASK",
            "log", "Gtk", "Gdk", "Adw", "Gio", "GdkPixbuf", "GLib", "Pango", "GObject",
-           "Manager", "Provider", "Group", "Channel", "Serie",
+           "Manager", "Provider", "Catalog", "Group", "Channel", "Serie",
            "tr", "async_function", "idle_function", "get_pixbuf_from_file", "init_logger", "select_path",
            "BADGES", "MOVIES_GROUP", "PROVIDERS_PATH", "EPG_PATH", "SERIES_GROUP", "TV_GROUP")
 
+import gc
 import gettext
+import gzip
 import json
 import locale
 import logging
+import multiprocessing
 import os
-import re
+import pickle
+import shutil
 import sys
 import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from hashlib import blake2b
+from itertools import chain, repeat
 from pathlib import Path
 
 import gi
 import requests
 
+from .m3u import (EXT_INF_TAG, PARAMS, SERIES, ContentFilter, EntryParser, get_chunks, get_group_type,
+                  is_compressed, open_playlist, parse_chunk)
 from .settings import Settings, Language
 
 gi.require_version("Gtk", "4.0")
@@ -122,11 +132,6 @@ tr = gettext.gettext
 theme = Gtk.IconTheme.get_for_display(Gdk.Display.get_default())
 theme.add_search_path(f".{BASE_PATH}icons")
 
-# M3U parsing regex
-PARAMS = re.compile(r'(\S+)="(.*?)"')
-EXT_INF = re.compile(r'^#EXTINF:(?P<duration>-?\d+?) ?(?P<params>.*),(?P<title>.*?)$')
-SERIES = re.compile(r"(?P<series>.*?) S(?P<season>.\d{1,2}).*E(?P<episode>.\d{1,2}.*)$", re.IGNORECASE)
-
 TV_GROUP, MOVIES_GROUP, SERIES_GROUP = range(3)
 
 BADGES = {'musik': "music", 'zeland': "newzealand"}
@@ -153,6 +158,30 @@ def idle_function(func):
     return wrapper
 
 
+# Number of the active gc_paused blocks [several providers are loaded concurrently].
+_gc_pauses = 0
+_gc_lock = threading.Lock()
+
+
+@contextmanager
+def gc_paused():
+    """ Disables the garbage collector for the block.
+
+        Concurrent blocks are counted, so the collector is enabled again only by the last one.
+    """
+    global _gc_pauses
+    with _gc_lock:
+        _gc_pauses += 1
+        gc.disable()
+    try:
+        yield
+    finally:
+        with _gc_lock:
+            _gc_pauses -= 1
+            if not _gc_pauses:
+                gc.enable()
+
+
 def slugify(string):
     """ Normalizes string, converts to lowercase,
         removes non-alpha characters,
@@ -161,6 +190,15 @@ def slugify(string):
     return "".join(x.lower() for x in string if x.isalnum())
 
 
+def to_dict(obj) -> dict:
+    """ Returns the object attributes as a dict. Used for JSON serialization of slotted classes. """
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    if hasattr(obj, "__slots__"):
+        return {k: getattr(obj, k) for k in obj.__slots__ if hasattr(obj, k)}
+    return vars(obj)
+
+
 def get_pixbuf_from_file(path, size=32, _cache={}) -> GdkPixbuf.Pixbuf:
     """ Returns a Pixbuf object from a file at a given size. """
     if path in _cache:
@@ -198,6 +236,91 @@ def select_path(parent, callback=None, select_file=False, filters=None):
         dialog.select_folder(parent=parent, callback=finish_func)
 
 
+class Catalog:
+    """ Immutable snapshot of the provider content.
+
+        The catalog is built privately and published with a single reference assignment (Provider.catalog),
+        so readers never see a partially loaded catalog. Readers that access several parts of the catalog
+        should take the reference once.
+        Published groups are not modified, with one exception: the series lists of the groups [M3U] are
+        assigned by the series index. It is built only in the main thread, and unchanged groups are shared
+        with the previous catalog, so they get the new series lists too.
+    """
+    __slots__ = ("groups", "channels", "movies", "_series", "diff", "playlist")
+    # Number of channels checked per step of the series indexing.
+    INDEX_STEP = 500
+
+    def __init__(self, groups=(), channels=(), movies=(), series=None, diff=None, playlist=()):
+        set_attr = super().__setattr__
+        set_attr("groups", tuple(groups))
+        set_attr("channels", tuple(channels))
+        set_attr("movies", tuple(movies))
+        # None -> Series are detected from the channel names on demand [M3U].
+        set_attr("_series", None if series is None else tuple(series))
+        # Changes compared to the previous catalog.
+        set_attr("diff", diff)
+        # All channels in the playlist order -> Source for the series indexing [M3U].
+        set_attr("playlist", tuple(playlist))
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable!")
+
+    @property
+    def series(self):
+        """ Builds the series index on the first access. Should only be used in the main thread! """
+        if self._series is None:
+            for __ in self.index_series():
+                pass
+        return self._series
+
+    @property
+    def series_ready(self) -> bool:
+        return self._series is not None
+
+    def index_series(self):
+        """ Detects series, seasons and episodes from the channel names.
+
+            Generator -> Can be run step by step in the main loop with low priority.
+            Should only be used in the main thread [the series lists of the groups are replaced].
+        """
+        series = {}
+        group_series = {}
+        groups = {g.name: g for g in self.groups}
+
+        for index, channel in enumerate(self.playlist):
+            if index % self.INDEX_STEP == 0:
+                yield True
+                if self._series is not None:
+                    return  # Already built.
+
+            f = SERIES.fullmatch(channel.name)
+            if not f:
+                continue
+
+            series_name, season_name, episode_name = f.group("series", "season", "episode")
+            serie = series.get(series_name)
+            if serie is None:
+                serie = Serie(series_name)
+                serie.logo = channel.logo
+                series[series_name] = serie
+
+            season = serie.seasons.get(season_name)
+            if season is None:
+                season = Season(season_name)
+                serie.seasons[season_name] = season
+            season.episodes[episode_name] = channel
+            serie.episodes.append(channel)
+
+            group = groups.get(channel.group_title)
+            if group:
+                # Dict -> Ordered set.
+                group_series.setdefault(group, {})[serie] = None
+
+        for group in self.groups:
+            group.series = list(group_series.get(group, ()))
+        super().__setattr__("_series", tuple(series.values()))
+
+
 class Provider:
     SEP = ":::"
 
@@ -207,10 +330,30 @@ class Provider:
         else:
             self.name = name
         self.path = os.path.join(PROVIDERS_PATH, slugify(self.name))
-        self.groups = []
-        self.channels = []
-        self.movies = []
-        self.series = []
+        self.catalog = Catalog()
+        self.loaded = False
+        # State of the playlist file from which the catalog is loaded.
+        self.catalog_key = None
+
+    @property
+    def groups(self):
+        return self.catalog.groups
+
+    @property
+    def channels(self):
+        return self.catalog.channels
+
+    @property
+    def movies(self):
+        return self.catalog.movies
+
+    @property
+    def series(self):
+        return self.catalog.series
+
+    @property
+    def diff(self):
+        return self.catalog.diff
 
     def get_info(self):
         return self.SEP.join((self.name, self.type_id, self.url, self.username, self.password, self.epg))
@@ -220,14 +363,10 @@ class Provider:
 
 
 class Group:
-    def __init__(self, name="", channels=None, series=None):
-        if "VOD" in name.split():
-            self.group_type = MOVIES_GROUP
-        elif "SERIES" in name.split():
-            self.group_type = SERIES_GROUP
-        else:
-            self.group_type = TV_GROUP
+    __slots__ = ("group_type", "name", "logo", "logo_path", "channels", "series", "is_default")
 
+    def __init__(self, name="", channels=None, series=None):
+        self.group_type = get_group_type(name)
         self.name = name
         self.logo = None
         self.logo_path = None
@@ -238,75 +377,138 @@ class Group:
     @staticmethod
     def from_dict(data: dict):
         gr = Group()
-        [setattr(gr, k, v) for k, v in data.items()]
+        [setattr(gr, k, v) for k, v in data.items() if k in Group.__slots__]
         gr.channels = [Channel.from_dict(c) for c in gr.channels]
         return gr
 
 
 class Serie:
+    __slots__ = ("name", "logo", "_logo_path", "seasons", "episodes")
+
     def __init__(self, name):
         self.name = name
         self.logo = None
-        self.logo_path = None
+        self._logo_path = None
         self.seasons = {}
         self.episodes = []
 
+    @property
+    def logo_path(self):
+        """ Defaults to the logo path of the first episode. """
+        if self._logo_path is None and self.logo and self.episodes:
+            return self.episodes[0].logo_path
+        return self._logo_path
+
+    @logo_path.setter
+    def logo_path(self, value):
+        self._logo_path = value
+
 
 class Season:
+    __slots__ = ("name", "episodes")
+
     def __init__(self, name):
         self.name = name
         self.episodes = {}
 
 
+class StringTable(dict):
+    """ Table of the repeated strings (flyweights).
+
+        Equal strings are replaced with a single instance.
+        Used per provider while loading the catalog.
+    """
+
+    def intern(self, value):
+        return value if value is None else self.setdefault(value, value)
+
+    def split_url(self, url):
+        """ Returns the interned URL prefix (up to the last '/') and the rest of the URL. """
+        index = url.rfind("/") + 1
+        return self.setdefault(url[:index], url[:index]), url[index:]
+
+
 class Channel:
-    def __init__(self, provider=None, info=None):
-        self.info = None
+    # Slots -> Significantly less memory for large catalogs.
+    __slots__ = ("id", "name", "logo", "group_title", "title", "_url_prefix", "_url", "_logo_path", "_provider_slug")
+    # Public attributes.
+    FIELDS = ("id", "name", "logo", "logo_path", "group_title", "title", "url")
+
+    def __init__(self):
         self.id = None
         self.name = None
         self.logo = None
-        self.logo_path = None
         self.group_title = None
         self.title = None
-        self.url = None
-
-        if provider and info:
-            self.init_data(info, provider)
-
-    def init_data(self, info, provider):
-        match = EXT_INF.fullmatch(info or "")
-        if match:
-            res = match.groupdict()
-            if 'params' in res:
-                params = dict(PARAMS.findall(res['params']))
-                self.id = params.get("tvg-id", None)
-                if "tvg-name" in params and params['tvg-name'].strip() != "":
-                    self.name = params['tvg-name'].strip()
-                if "tvg-logo" in params and params['tvg-logo'].strip() != "":
-                    self.logo = params['tvg-logo'].strip()
-                if "group-title" in params and params['group-title'].strip() != "":
-                    self.group_title = params['group-title'].strip().replace(";", " ").replace("  ", " ")
-            if 'title' in res:
-                self.title = res['title']
-        if self.name is None and "," in info:
-            self.name = info.split(",")[-1].strip()
-        if self.logo:
-            if self.logo.startswith("file://"):
-                self.logo_path = self.logo[7:]
-            else:
-                ext = None
-                for known_ext in [".png", ".jpg", ".gif", ".jpeg"]:
-                    if self.logo.lower().endswith(known_ext):
-                        ext = known_ext
-                        break
-                if ext == ".jpeg":
-                    ext = ".jpg"
-
-                self.logo_path = self.get_logo_path(provider.name, self.name, ext)
+        self._url_prefix = ""
+        self._url = None
+        self._logo_path = None
+        # Not None -> The logo path is not resolved yet.
+        self._provider_slug = None
+
+    @property
+    def url(self):
+        """ The full URL is rebuilt from the shared prefix on each access. """
+        return f"{self._url_prefix}{self._url}" if self._url_prefix else self._url
+
+    @url.setter
+    def url(self, value):
+        self._url_prefix, self._url = "", value
+
+    @property
+    def logo_path(self):
+        """ The local logo path is resolved on the first access. """
+        if self._provider_slug is not None:
+            self._logo_path, self._provider_slug = self.resolve_logo_path(self._provider_slug), None
+        return self._logo_path
+
+    @logo_path.setter
+    def logo_path(self, value):
+        self._logo_path, self._provider_slug = value, None
+
+    def init_logo_path(self, provider_slug):
+        """ Defers resolving of the logo path until it is needed. """
+        self._logo_path = None
+        self._provider_slug = provider_slug if self.logo else None
+
+    def resolve_logo_path(self, provider_slug):
+        if self.logo.startswith("file://"):
+            return self.logo[7:]
+
+        ext = None
+        for known_ext in [".png", ".jpg", ".gif", ".jpeg"]:
+            if self.logo.lower().endswith(known_ext):
+                ext = known_ext
+                break
+        if ext == ".jpeg":
+            ext = ".jpg"
+
+        return os.path.join(PROVIDERS_PATH, f"{provider_slug}-{slugify(self.name)}{ext}")
 
     @staticmethod
     def from_dict(data: dict):
         ch = Channel()
-        [setattr(ch, k, v) for k, v in data.items()]
+        # Stored data may contain additional attributes (e.g. from the XTream channels).
+        [setattr(ch, k, v) for k, v in data.items() if k in Channel.FIELDS]
+        return ch
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.FIELDS}
+
+    @staticmethod
+    def from_entry(provider_slug, entry, strings=None):
+        """ Creates a channel from the playlist entry -> (id, name, logo, group title, title, url).
+
+            If a string table is given, the repeated strings are shared between channels.
+        """
+        ch = Channel()
+        ch.id, ch.name, ch.logo, ch.group_title, ch.title, url = entry
+        if strings is None:
+            ch.url = url
+        else:
+            ch.logo, ch.group_title = strings.intern(ch.logo), strings.intern(ch.group_title)
+            ch._url_prefix, ch._url = strings.split_url(url)
+        ch.init_logo_path(provider_slug)
         return ch
 
     @staticmethod
@@ -314,12 +516,293 @@ class Channel:
         return os.path.join(PROVIDERS_PATH, f"{slugify(provider_name)}-{slugify(channel_name)}{ext}")
 
 
+class CatalogDiff:
+    """ Changes of the provider catalog after reload.
+
+        Grouped by the group title -> added and removed channels, changed channels (old -> new).
+    """
+
+    def __init__(self):
+        self.added = {}
+        self.removed = {}
+        self.changed = {}
+
+    def __bool__(self):
+        return any((self.added, self.removed, self.changed))
+
+    def __str__(self):
+        added, removed, changed = (sum(map(len, d.values())) for d in (self.added, self.removed, self.changed))
+        return f"{added} added, {removed} removed, {changed} changed"
+
+    @property
+    def groups(self) -> set:
+        """ Titles of the changed groups. """
+        return self.added.keys() | self.removed.keys() | self.changed.keys()
+
+
+class DedupIndex:
+    """ Cross-provider channel index.
+
+        The same stream often appears in several providers. Channels are matched by the normalized URL
+        and the tvg-id. New channels identical to an already indexed one share its record, and duplicates
+        with the same logo share its logo path, so the logo is downloaded once and the EPG binding is the same.
+        Thread-safe -> Providers are loaded concurrently.
+        The index takes ~200 bytes per channel, so it is only built when several providers are used.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enabled = True
+        # Keys are hashes -> They take much less memory than the URLs.
+        # Collisions are harmless: records are shared only for identical channels.
+        # URL key -> canonical channel.
+        self._channels = {}
+        # Provider name -> (indexed catalog, URL keys, tvg-id keys).
+        self._providers = {}
+        # Provider name -> number of channels also present in other providers.
+        self._duplicates = {}
+
+    @property
+    def providers(self) -> set:
+        return set(self._providers)
+
+    @staticmethod
+    def get_url_key(url):
+        """ Scheme and host are case-insensitive. Trailing slashes are ignored. """
+        url = url.strip().rstrip("/")
+        end = url.find("/", url.find("://") + 3)
+        return hash(url[:end].lower() + url[end:] if end > 0 else url.lower())
+
+    @staticmethod
+    def get_id_key(ch_id):
+        ch_id = ch_id.strip() if ch_id else None
+        return hash(ch_id.lower()) if ch_id else None
+
+    @staticmethod
+    def get_channels(catalog):
+        """ M3U -> All channels in the playlist order. Xtream -> Live channels and movies. """
+        return catalog.playlist or chain(catalog.channels, catalog.movies)
+
+    def get_channel(self, entry):
+        """ Returns the indexed channel identical to the playlist entry, or None. """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            ch = self._channels.get(self.get_url_key(entry[-1]))
+        if ch and (ch.id, ch.name, ch.logo, ch.group_title, ch.title, ch.url) == entry:
+            return ch
+
+    def update(self, name, catalog):
+        """ Indexes the provider catalog instead of the previous one. """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._remove(name)
+            urls, ids = set(), set()
+            channels = self._channels
+            for ch in self.get_channels(catalog):
+                key = self.get_url_key(ch.url)
+                urls.add(key)
+                canonical = channels.get(key)
+                if canonical is None:
+                    # Only M3U channels can be shared.
+                    if type(ch) is Channel:
+                        channels[key] = ch
+                elif canonical is not ch and type(ch) is Channel:
+                    if ch.logo and ch.logo == canonical.logo and ch.logo_path != canonical.logo_path:
+                        ch.logo_path = canonical.logo_path
+
+                key = self.get_id_key(ch.id)
+                if key is not None:
+                    ids.add(key)
+
+            self._providers[name] = (catalog, urls, ids)
+            self.count_duplicates()
+
+    def remove(self, name):
+        with self._lock:
+            self._remove(name)
+            self.count_duplicates()
+
+    def sync(self, names):
+        """ Removes providers that are no longer present. A single provider has nothing to share. """
+        names = set(names)
+        self.enabled = len(names) > 1
+        [self.remove(n) for n in (self.providers - names if self.enabled else self.providers)]
+
+    def _remove(self, name):
+        catalog, urls, ids = self._providers.pop(name, (None, (), ()))
+        if catalog is None:
+            return
+
+        channels = self._channels
+        # Shared records are kept for other providers.
+        other_urls = [u for c, u, i in self._providers.values()]
+        for ch in self.get_channels(catalog):
+            key = self.get_url_key(ch.url)
+            if channels.get(key) is ch and not any(key in u for u in other_urls):
+                del channels[key]
+
+    def count_duplicates(self):
+        self._duplicates.clear()
+        for name, (catalog, urls, ids) in self._providers.items():
+            other_urls, other_ids = set(), set()
+            for n, (c, u, i) in self._providers.items():
+                if n != name:
+                    other_urls.update(u)
+                    other_ids.update(i)
+
+            count = 0
+            if urls & other_urls or ids & other_ids:
+                url_key, id_key = self.get_url_key, self.get_id_key
+                for ch in self.get_channels(catalog):
+                    if url_key(ch.url) in other_urls or id_key(ch.id) in other_ids:
+                        count += 1
+            self._duplicates[name] = count
+
+    def get_duplicates(self, name) -> int:
+        """ Returns the number of the provider channels also present in other providers. """
+        return self._duplicates.get(name, 0)
+
+
+class PlaylistParser:
+    """ Incremental M3U playlist parser.
+
+        Lines are fed one by one, so the playlist can be parsed
+        from a file as well as directly from the download stream.
+        Already parsed entries can also be added directly (e.g. from child processes).
+
+        If the provider is already loaded, unchanged channels and groups of the previous catalog are kept,
+        and the changes are passed to the provider as CatalogDiff.
+        Entries rejected by the content filter are skipped before any channel objects are created.
+        Channels identical to the ones of other providers are shared via DedupIndex.
+    """
+
+    def __init__(self, provider, debug=None, content_filter=None, dedup=None):
+        self.provider = provider
+        self.dedup = dedup
+        self.debug = debug or (lambda *args: None)
+        self.groups = []
+        self.channels = []
+        self.movies = []
+        self.playlist = []
+
+        self._reader = EntryParser(content_filter)
+        self._strings = StringTable()
+        self._slug = slugify(provider.name)
+        self._group = None
+        self._groups = {}
+        # Previous catalog -> (url, tvg-id) -> [channel].
+        self._previous = None
+        self._diff = None
+
+        if provider.loaded:
+            self._previous = {}
+            self._diff = CatalogDiff()
+            catalog = provider.catalog
+            for ch in chain(catalog.channels, catalog.movies, *(g.channels for g in catalog.groups)):
+                channels = self._previous.setdefault((ch.url, ch.id), [])
+                if ch not in channels:
+                    channels.append(ch)
+
+    def feed(self, line):
+        entry = self._reader.feed(line)
+        if entry:
+            self.add_entry(entry)
+
+    def new_channel(self, entry):
+        """ Returns the identical channel of another provider or creates a new one. """
+        channel = self.dedup.get_channel(entry) if self.dedup else None
+        return channel or Channel.from_entry(self._slug, entry, self._strings)
+
+    def get_channel(self, entry):
+        """ Returns the unchanged channel from the previous catalog or creates a new one. """
+        if self._previous is None:
+            return self.new_channel(entry)
+
+        ch_id, url = entry[0], entry[-1]
+        channels = self._previous.get((url, ch_id))
+        if not channels:
+            channel = self.new_channel(entry)
+            self._diff.added.setdefault(channel.group_title, set()).add(channel)
+            return channel
+
+        old = channels.pop(0)
+        if (old.id, old.name, old.logo, old.group_title, old.title, old.url) == entry:
+            return old
+
+        channel = self.new_channel(entry)
+        if old.group_title == channel.group_title:
+            self._diff.changed.setdefault(channel.group_title, {})[old] = channel
+        else:
+            self._diff.removed.setdefault(old.group_title, set()).add(old)
+            self._diff.added.setdefault(channel.group_title, set()).add(channel)
+        return channel
+
+    def add_entry(self, entry):
+        channel = self.get_channel(entry)
+        self.debug("New channel: ", channel.name, channel.url)
+
+        # Series are indexed on demand -> Catalog.index_series.
+        self.playlist.append(channel)
+        if channel.group_title and channel.group_title.strip() != "":
+            group = self._group
+            if group is None or group.name != channel.group_title:
+                if channel.group_title in self._groups.keys():
+                    group = self._groups[channel.group_title]
+                else:
+                    group = Group(channel.group_title)
+                    self.groups.append(group)
+                    self._groups[channel.group_title] = group
+                self._group = group
+            group.channels.append(channel)
+            if group.group_type == TV_GROUP:
+                self.channels.append(channel)
+            elif group.group_type == MOVIES_GROUP:
+                self.movies.append(channel)
+        else:
+            self.channels.append(channel)
+
+    def close(self):
+        """ Passes the parsed data to the provider. """
+        if self._previous is not None:
+            for channels in self._previous.values():
+                for ch in channels:
+                    self._diff.removed.setdefault(ch.group_title, set()).add(ch)
+            # Unchanged groups are kept.
+            previous = {g.name: g for g in self.provider.catalog.groups}
+            for index, group in enumerate(self.groups):
+                old = previous.get(group.name)
+                if old and group.name not in self._diff.groups and old.channels == group.channels:
+                    self.groups[index] = old
+            log(f"{self.provider.name}: Catalog changes -> {self._diff}")
+
+        self.provider.catalog = Catalog(self.groups, self.channels, self.movies, diff=self._diff,
+                                        playlist=self.playlist)
+        self.provider.loaded = True
+
+
 class Manager:
+    # Size of the data block for downloading and validating playlists.
+    BLOCK_SIZE = 4 * 1024 * 1024  # 4 MB
+    # Playlists (files) larger than this size are parsed in child processes.
+    PARALLEL_PARSING_SIZE = 64 * 1024 * 1024  # 64 MB
+    MAX_PARSING_WORKERS = 8
+    # Version of the catalog snapshot format. Should be changed with any model changes!
+    SNAPSHOT_VERSION = 5
+    SNAPSHOT_HASH_SIZE = 1024 * 1024  # 1 MB
+    # Downloaded playlists are stored compressed [except for playlists parsed in child processes].
+    COMPRESS_LEVEL = 6
+    MAX_RESUME_ATTEMPTS = 3
 
     def __init__(self, settings):
         os.makedirs(PROVIDERS_PATH, exist_ok=True)
         self.verbose = False
         self.settings = settings
+        # Shared by all providers.
+        self.dedup = DedupIndex()
 
     def debug(self, *args):
         if self.verbose:
@@ -328,6 +811,9 @@ class Manager:
     def get_playlist(self, provider, refresh=False) -> bool:
         """Get the playlist from the provided URL
 
+        The downloaded playlist is parsed on the fly and stored to the disk at the same time.
+        In this case, the provider is already loaded when this method returns.
+
         Args:
             provider ([type]): [description]
             refresh (bool, optional): [description]. Defaults to False.
@@ -351,127 +837,332 @@ class Manager:
                     'User-Agent': self.settings.get_string("user-agent"),
                     'Referer': self.settings.get_string("http-referer")
                 }
+                request_headers = dict(headers)
+                if os.path.isfile(provider.path):
+                    request_headers.update(self.get_validators(provider))
                 try:
-                    response = requests.get(provider.url, headers=headers, timeout=(5, 120), stream=True)
+                    response = requests.get(provider.url, headers=request_headers, timeout=(5, 120), stream=True)
                     # If there is an answer from the remote server
                     if response.status_code == 200:
-                        # Set downloaded size
-                        downloaded_bytes = 0
-                        # Get total playlist byte size
-                        total_content_size = int(response.headers.get('content-length', 15))
-                        # Set stream blocks
-                        block_bytes = int(4 * 1024 * 1024)  # 4 MB
-                        response.encoding = response.encoding or response.apparent_encoding
-
-                        with open(provider.path, "w", encoding=response.encoding) as file:
-                            # Grab data by block_bytes
-                            for data in response.iter_content(block_bytes, decode_unicode=True):
-                                downloaded_bytes += block_bytes
-                                log(f"{downloaded_bytes} bytes")
-                                file.write(str(data))
-                        if downloaded_bytes < total_content_size:
-                            log("The file size is incorrect, deleting")
-                            os.remove(provider.path)
-                        else:
-                            ret_code = True
+                        ret_code = self.download_playlist(provider, response, headers)
+                        if ret_code:
+                            self.save_validators(provider, response)
+                    elif response.status_code == 304:
+                        # Not modified -> The cached playlist (and its catalog snapshot) is used.
+                        self.debug(f"Playlist not modified: {provider.name}")
+                        response.close()
+                        ret_code = True
                     else:
                         log(f"HTTP error {response.status_code} while retrieving from {provider.url}!")
                 except Exception as e:
                     log(e)
+
+                if not ret_code and os.path.isfile(provider.path):
+                    # The previous playlist is never replaced by a failed download.
+                    log(f"{provider.name}: Using the previously downloaded playlist.")
+                    ret_code = True
         else:
             # No protocol, assume it's local
             provider.path = provider.url
 
         return ret_code
 
+    def download_playlist(self, provider, response, headers) -> bool:
+        """ Downloads the playlist to a temporary file and parses it in a single pass.
+
+            Interrupted transfers are resumed with HTTP Range requests (if supported by the server).
+            The cached playlist is replaced only after the size verification.
+        """
+        tmp_path = f"{provider.path}.part"
+        # Get total playlist byte size
+        total_size = int(response.headers.get("content-length", 0))
+        # Byte ranges are only reliable for the not encoded content.
+        encoded = "content-encoding" in response.headers
+        resumable = all((not encoded, total_size, response.headers.get("accept-ranges") == "bytes"))
+        validator = response.headers.get("etag") or response.headers.get("last-modified")
+        # Large playlists are stored uncompressed, so they can be split into chunks for the parallel parsing.
+        # The size of the encoded content is known only after downloading.
+        compress = encoded or not self.is_parallel_parsing(total_size)
+
+        parser = PlaylistParser(provider, self.debug, self.get_content_filter(provider), self.dedup)
+        downloaded_bytes = 0
+        attempts = 0
+        tail = b""
+        # The first bytes are collected for the playlist check. The received blocks can be small [chunked, gzip].
+        head = bytearray()
+        checked = False
+
+        def write(block):
+            nonlocal tail
+            file.write(block)
+            # Parsing complete lines only. The rest is waiting for the next block.
+            lines = (tail + block).split(b"\n")
+            tail = lines.pop()
+            for line in lines:
+                parser.feed(line.decode("utf-8", errors="ignore"))
+
+        try:
+            # The content is decoded by 'requests' according to the negotiated Content-Encoding.
+            with (gzip.open(tmp_path, "wb", compresslevel=self.COMPRESS_LEVEL) if compress
+                  else open(tmp_path, "wb")) as file:
+                while True:
+                    try:
+                        for data in response.iter_content(self.BLOCK_SIZE):
+                            downloaded_bytes += len(data)
+                            log(f"{downloaded_bytes} bytes")
+                            if not checked:
+                                head += data
+                                start = max(0, len(head) - len(data) - len(EXT_INF_TAG))
+                                if len(head) < self.BLOCK_SIZE and head.find(EXT_INF_TAG, start) < 0:
+                                    continue
+                                if not self.is_playlist(head):
+                                    log(f"Nope: {provider.url}")
+                                    return False
+                                checked, data = True, bytes(head)
+                            write(data)
+                        break
+                    except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError) as e:
+                        attempts += 1
+                        if not resumable or attempts > self.MAX_RESUME_ATTEMPTS:
+                            raise
+                        log(f"{provider.name}: Download interrupted at {downloaded_bytes} bytes [{e}]. Resuming...")
+                        response = self.resume_download(provider, headers, downloaded_bytes, validator)
+
+                if not checked:
+                    # The whole playlist is smaller than the checked block.
+                    if not self.is_playlist(head):
+                        log(f"Nope: {provider.url}")
+                        return False
+                    write(bytes(head))
+
+            # Content-Length of the encoded content is the size of the transferred (compressed) data.
+            received = response.raw.tell() if encoded else downloaded_bytes
+            if not downloaded_bytes or (total_size and received != total_size):
+                log(f"{provider.name}: The file size is incorrect [{received} of {total_size} bytes].")
+                return False
+
+            if compress and self.is_parallel_parsing(downloaded_bytes):
+                self.decompress_playlist(tmp_path)
+            os.replace(tmp_path, provider.path)
+        finally:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+        parser.feed(tail.decode("utf-8", errors="ignore"))
+        parser.close()
+        self.save_snapshot(provider)
+        return True
+
+    @staticmethod
+    def resume_download(provider, headers, start, validator):
+        """ Requests the rest of the playlist starting from the given byte position. """
+        headers = {**headers, "Range": f"bytes={start}-", "Accept-Encoding": "identity"}
+        if validator:
+            # The whole playlist is sent instead of the range if it has been changed.
+            headers["If-Range"] = validator
+
+        response = requests.get(provider.url, headers=headers, timeout=(5, 120), stream=True)
+        if response.status_code != 206 or not response.headers.get("content-range", "").startswith(f"bytes {start}-"):
+            response.close()
+            raise requests.exceptions.HTTPError(f"Resuming is not possible [HTTP {response.status_code}].")
+
+        return response
+
+    def decompress_playlist(self, path):
+        """ Replaces the compressed playlist file with the uncompressed one. """
+        tmp_path = f"{path}.tmp"
+        try:
+            with gzip.open(path, "rb") as src, open(tmp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, self.BLOCK_SIZE)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+    # ******************** Conditional requests ******************** #
+
+    @staticmethod
+    def get_validators_path(provider):
+        return f"{provider.path}.validators"
+
+    def get_validators(self, provider) -> dict:
+        """ Returns conditional request headers for the cached playlist. """
+        try:
+            with open(self.get_validators_path(provider), "r", encoding="utf-8") as file:
+                validators = json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators.get("etag")
+        if validators.get("last-modified"):
+            headers["If-Modified-Since"] = validators.get("last-modified")
+        return headers
+
+    def save_validators(self, provider, response):
+        """ Stores ETag and Last-Modified response headers next to the playlist file. """
+        validators = {k: response.headers.get(k) for k in ("etag", "last-modified") if response.headers.get(k)}
+        if not validators:
+            self.remove_validators(provider)
+            return
+
+        try:
+            with open(self.get_validators_path(provider), "w", encoding="utf-8") as file:
+                json.dump(validators, file)
+        except OSError as e:
+            log(f"{provider.name}: Storing validators error: {e}")
+
+    def remove_validators(self, provider):
+        path = self.get_validators_path(provider)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    @staticmethod
+    def is_playlist(data: bytes) -> bool:
+        """ Checks if the first block of data looks like an M3U playlist. """
+        return b"#EXTM3U" in data and b"#EXTINF" in data
+
     def check_playlist(self, provider):
         legit = False
         if os.path.exists(provider.path):
-            with open(provider.path, "r", encoding="utf-8", errors="ignore") as file:
-                content = file.read()
-                if "#EXTM3U" in content and "#EXTINF" in content:
+            with open_playlist(provider.path, "rb") as file:
+                if self.is_playlist(file.read(self.BLOCK_SIZE)):
                     legit = True
                     self.debug(f"Content looks legit: {provider.name}")
                 else:
                     self.debug(f"Nope: {provider.path}")
         return legit
 
+    def get_content_filter(self, provider):
+        """ Returns the content filter of the provider [settings -> "provider-filters"]. """
+        return ContentFilter(self.settings.get_value("provider-filters").get(provider.name))
+
     def load_channels(self, provider):
-        with open(provider.path, "r", encoding="utf-8", errors="ignore") as file:
-            channel = None
-            group = None
-            groups = {}
-            series = {}
+        if provider.loaded and provider.catalog_key == self.get_catalog_key(provider):
+            self.debug(f"Catalog is up to date: {provider.name}")
+            return
+
+        if not provider.loaded and self.restore_snapshot(provider):
+            return
+
+        # Compressed files can't be split into chunks.
+        if self.is_parallel_parsing(os.path.getsize(provider.path)) and not is_compressed(provider.path):
+            try:
+                self.load_channels_parallel(provider, self.get_parsing_workers())
+            except Exception as e:
+                log(f"{provider.name}: Parallel parsing error: {e}")
+            else:
+                self.save_snapshot(provider)
+                return
+
+        parser = PlaylistParser(provider, self.debug, self.get_content_filter(provider), self.dedup)
+        with open_playlist(provider.path) as file:
             for line in file:
-                line = line.strip()
-                if line.startswith("#EXTM3U"):
-                    continue
-                if line.startswith("#EXTINF"):
-                    channel = Channel(provider, line)
-                    self.debug("New channel: ", line)
-                    continue
-                if "://" in line and not (line.startswith("#")):
-                    self.debug("    ", line)
-                    if channel is None:
-                        self.debug("    --> channel is None")
-                        continue
-                    if channel.url:
-                        # We already found the URL, skip the line
-                        self.debug("    --> channel URL was already found")
-                        continue
-                    if channel.name is None or "***" in channel.name:
-                        self.debug("    --> channel name is None")
-                        continue
-                    channel.url = line
-                    self.debug("    --> URL found: ", line)
-
-                    serie = None
-                    f = SERIES.fullmatch(channel.name)
-                    if f:
-                        res = f.groupdict()
-                        series_name = res['series']
-                        if series_name in series.keys():
-                            serie = series[series_name]
-                        else:
-                            serie = Serie(series_name)
-                            # TODO put in group
-                            provider.series.append(serie)
-                            series[series_name] = serie
-                            serie.logo = channel.logo
-                            serie.logo_path = channel.logo_path
-                        season_name = res['season']
-                        if season_name in serie.seasons.keys():
-                            season = serie.seasons[season_name]
-                        else:
-                            season = Season(season_name)
-                            serie.seasons[season_name] = season
-
-                        episode_name = res['episode']
-                        season.episodes[episode_name] = channel
-                        serie.episodes.append(channel)
-
-                    if channel.group_title and channel.group_title.strip() != "":
-                        if group is None or group.name != channel.group_title:
-                            if channel.group_title in groups.keys():
-                                group = groups[channel.group_title]
-                            else:
-                                group = Group(channel.group_title)
-                                provider.groups.append(group)
-                                groups[channel.group_title] = group
-                        if serie and serie not in group.series:
-                            group.series.append(serie)
-                        group.channels.append(channel)
-                        if group.group_type == TV_GROUP:
-                            provider.channels.append(channel)
-                        elif group.group_type == MOVIES_GROUP:
-                            provider.movies.append(channel)
-                    else:
-                        provider.channels.append(channel)
+                parser.feed(line)
+        parser.close()
+        self.save_snapshot(provider)
+
+    def get_parsing_workers(self):
+        return min(os.cpu_count() or 1, self.MAX_PARSING_WORKERS)
+
+    def is_parallel_parsing(self, size) -> bool:
+        """ Checks if the playlist of the given (uncompressed) size is parsed in child processes. """
+        # Child processes are not used in the frozen (bundled) app.
+        return all((self.get_parsing_workers() > 1, not IS_FROZEN, size > self.PARALLEL_PARSING_SIZE))
+
+    def load_channels_parallel(self, provider, workers):
+        """ Parses the playlist chunks in child processes.
+
+            The chunks are split at #EXTINF boundaries, and the results are merged in the file order,
+            so groups and series are the same as from the serial parser.
+        """
+        chunks = get_chunks(provider.path, workers)
+        log(f"{provider.name}: Parsing playlist in {len(chunks)} chunks...")
+        content_filter = self.get_content_filter(provider)
+        parser = PlaylistParser(provider, self.debug, content_filter, self.dedup)
+        # 'spawn' -> The child processes must not inherit the state of the GUI threads.
+        context = multiprocessing.get_context("spawn")
+
+        with ProcessPoolExecutor(max_workers=len(chunks), mp_context=context) as executor:
+            starts, ends = zip(*chunks)
+            for entries in executor.map(parse_chunk, repeat(provider.path), starts, ends, repeat(content_filter)):
+                [parser.add_entry(e) for e in entries]
+
+        parser.close()
+
+    # ******************** Catalog snapshot ******************** #
+
+    @staticmethod
+    def get_snapshot_path(provider):
+        """ Returns the path of the pre-parsed catalog snapshot.
+
+            Local playlists may be located anywhere, so snapshots are always kept in the cache.
+        """
+        return os.path.join(PROVIDERS_PATH, f"{slugify(provider.name)}.catalog")
+
+    def get_playlist_key(self, path):
+        """ Returns a key that identifies the current state of the playlist file.
+
+            To keep it fast for huge playlists, only the beginning and the end of the file are hashed.
+            Together with the size and modification time, this is enough to notice any update.
+        """
+        st = os.stat(path)
+        digest = blake2b(digest_size=16)
+        with open(path, "rb") as file:
+            digest.update(file.read(self.SNAPSHOT_HASH_SIZE))
+            if st.st_size > self.SNAPSHOT_HASH_SIZE:
+                file.seek(-min(self.SNAPSHOT_HASH_SIZE, st.st_size - self.SNAPSHOT_HASH_SIZE), os.SEEK_END)
+                digest.update(file.read())
+
+        return st.st_size, st.st_mtime_ns, digest.hexdigest()
+
+    def get_catalog_key(self, provider):
+        """ Returns a key that identifies the catalog -> playlist state + content filter rules. """
+        return *self.get_playlist_key(provider.path), self.get_content_filter(provider).key
+
+    def save_snapshot(self, provider):
+        """ Stores the parsed provider catalog in a binary form. """
+        path = self.get_snapshot_path(provider)
+        try:
+            catalog = provider.catalog
+            provider.catalog_key = self.get_catalog_key(provider)
+            data = (self.SNAPSHOT_VERSION, provider.catalog_key,
+                    (catalog.groups, catalog.channels, catalog.movies, catalog.playlist))
+            with open(f"{path}.tmp", "wb") as file:
+                pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{path}.tmp", path)
+        except (OSError, pickle.PickleError, RecursionError) as e:
+            log(f"{provider.name}: Storing catalog snapshot error: {e}")
+
+    def restore_snapshot(self, provider) -> bool:
+        """ Restores the provider catalog if the snapshot matches the current playlist file. """
+        path = self.get_snapshot_path(provider)
+        if not os.path.isfile(path):
+            return False
+
+        try:
+            # Disabling the garbage collector noticeably speeds up loading a large number of objects.
+            with gc_paused(), open(path, "rb") as file:
+                version, key, catalog = pickle.load(file)
+            if version != self.SNAPSHOT_VERSION or key != self.get_catalog_key(provider):
+                self.debug(f"Outdated catalog snapshot: {provider.name}")
+                return False
+        except Exception as e:
+            log(f"{provider.name}: Restoring catalog snapshot error: {e}")
+            return False
+
+        groups, channels, movies, playlist = catalog
+        provider.catalog = Catalog(groups, channels, movies, playlist=playlist)
+        provider.catalog_key = key
+        provider.loaded = True
+        self.debug(f"Catalog restored from snapshot: {provider.name}")
+        return True
 
     @staticmethod
     def get_m3u_tvg_info(path):
         """ Returns "x-tvg-url" parameter value from the local file. """
-        with open(path, "r") as file:
+        with open_playlist(path) as file:
             line = file.readline()
             if line.startswith("#EXTM3U"):
                 return dict(PARAMS.findall(line)).get("x-tvg-url", "")
@@ -492,7 +1183,7 @@ class Manager:
     def save_favorites(self, groups):
         """ Stores the current favorites groups. """
         try:
-            Path(FAVORITES_PATH).write_text(json.dumps(groups, default=vars))
+            Path(FAVORITES_PATH).write_text(json.dumps(groups, default=to_dict))
         except Exception as e:
             self.debug(f"Storing favorites error: {e}")
 
@@ -508,10 +1199,47 @@ class Manager:
     def save_history(self, channels):
         """ Saves channel viewing history. """
         try:
-            Path(HISTORY_PATH).write_text(json.dumps(channels, default=vars))
+            Path(HISTORY_PATH).write_text(json.dumps(channels, default=to_dict))
         except Exception as e:
             self.debug(f"Storing history error: {e}")
 
 
+def benchmark_memory(path):
+    """ Compares the memory used by the channels with the previous model (dict-backed, without shared strings).
+
+        Usage: python3 -m app.common <playlist path>
+    """
+    import tracemalloc
+
+    class DictChannel:
+        """ Previous channel model. """
+
+        def __init__(self, entry):
+            self.info = None
+            self.id, self.name, self.logo, self.group_title, self.title, self.url = entry
+            self.logo_path = Channel.resolve_logo_path(self, slugify(provider.name)) if self.logo else None
+
+    def get_size(factory):
+        tracemalloc.start()
+        reader = EntryParser()
+        with open_playlist(path) as file:
+            channels = [factory(e) for e in map(reader.feed, file) if e]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size, len(channels)
+
+    provider = Provider("benchmark", None)
+    dict_size, count = get_size(DictChannel)
+    strings = StringTable()
+    slug = slugify(provider.name)
+    slots_size, count = get_size(lambda e: Channel.from_entry(slug, e, strings))
+
+    print(f"Channels: {count}")
+    print(f"Previous model: {dict_size / 1024 / 1024:.1f} MB, {dict_size / count:.0f} B per channel")
+    print(f"Current model: {slots_size / 1024 / 1024:.1f} MB, {slots_size / count:.0f} B per channel")
+    print(f"Saved: {(dict_size - slots_size) / 1024 / 1024:.1f} MB")
+
+
 if __name__ == '__main__':
-    pass
+    if len(sys.argv) > 1:
+        benchmark_memory(sys.argv[1])
@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2026 Dmitriy Yefremov <https://github.com/DYefremov>
+#
+# This file is part of TVDemon.
+#
+# TVDemon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# TVDemon is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with TVDemon  If not, see <http://www.gnu.org/licenses/>.
+#
+# Author: Dmitriy Yefremov
+#
+
+
+""" Module for parsing M3U playlists.
+
+    Contains only plain Python code without any GUI dependencies,
+    so it can also be used in child processes.
+"""
+import gzip
+import io
+import json
+import os
+import re
+from fnmatch import translate
+from operator import itemgetter
+
+# M3U parsing regex
+PARAMS = re.compile(r'(\S+)="(.*?)"')
+EXT_INF = re.compile(r'^#EXTINF:(?P<duration>-?\d+?) ?(?P<params>.*),(?P<title>.*?)$')
+SERIES = re.compile(r"(?P<series>.*?) S(?P<season>.\d{1,2}).*E(?P<episode>.\d{1,2}.*)$", re.IGNORECASE)
+# The duration of EXT_INF -> the rest of the digits belongs to the params.
+EXT_INF_HEADER = re.compile(r"#EXTINF:-?\d ?")
+
+# Attributes used by the application -> index in the parsing result.
+ATTRS = {"tvg-id": 0, "tvg-name": 1, "tvg-logo": 2, "group-title": 3}
+# Key layout of the #EXTINF line -> getter of the used values.
+_LAYOUTS = {}
+MAX_LAYOUTS = 1024
+
+# Content types -> index corresponds to the group type [TV_GROUP, MOVIES_GROUP, SERIES_GROUP].
+CONTENT_TYPES = ("live", "movies", "series")
+# Adult content detection by the group title.
+ADULT = re.compile(r"\b(adults?|xxx|porno?)\b|18\+", re.IGNORECASE)
+
+GZIP_MAGIC = b"\x1f\x8b"
+EXT_INF_TAG = b"#EXTINF"
+# Size of the block for searching chunk boundaries.
+SEARCH_BLOCK_SIZE = 1024 * 1024  # 1 MB
+
+
+def parse_ext_inf(info):
+    """ Parses the #EXTINF line.
+
+        Only the attributes used by the application are extracted.
+        The line is split by quotes, so even parts are keys and odd parts are values.
+        The positions of the used values depend only on the keys, so they are cached
+        per key layout [usually the same for all lines of the playlist].
+        The result corresponds to the EXT_INF + PARAMS regex matching.
+
+        Returns tuple -> (id, name, logo, group title, title).
+    """
+    # Title -> after the last comma.
+    comma = info.rfind(",")
+    if comma < 0:
+        return None, None, None, None, None
+
+    parts = info[:comma].split('"')
+    keys = tuple(parts[::2])
+    layout = _LAYOUTS.get(keys)
+    if layout is None:
+        if len(_LAYOUTS) >= MAX_LAYOUTS:
+            _LAYOUTS.clear()
+        layout = _LAYOUTS[keys] = get_layout(keys)
+    if not layout:
+        # Irregular line.
+        return parse_ext_inf_re(info)
+
+    # Missing attributes -> the last item.
+    parts.append(None)
+    ch_id, name, logo, group_title = layout(parts)
+    title = info[comma + 1:]
+    name = name and name.strip() or title.strip()
+    logo = logo and logo.strip() or None
+    group_title = group_title and group_title.strip().replace(";", " ").replace("  ", " ") or None
+
+    return ch_id, name, logo, group_title, title
+
+
+def get_layout(keys):
+    """ Returns getter of the used values [id, name, logo, group title] by the key parts of the #EXTINF line.
+
+        Returns False if the line can't be split by quotes in the same way as with the regex.
+    """
+    header = EXT_INF_HEADER.match(keys[0])
+    if not header:
+        return False
+
+    indexes = [-1, -1, -1, -1]
+    keys = (keys[0][header.end():], *keys[1:])[:-1]  # The last part has no value.
+    for pos, key in enumerate(keys):
+        # The key must be directly before the value [like "\S+=" in the regex].
+        if not key.endswith("="):
+            return False
+        name = key.rsplit(None, 1)[-1]
+        if len(name) < 2:
+            return False
+        index = ATTRS.get(name[:-1])
+        if index is not None:
+            indexes[index] = pos * 2 + 1
+
+    return itemgetter(*indexes)
+
+
+def normalize_group_title(title):
+    return title.strip().replace(";", " ").replace("  ", " ") or None
+
+
+def get_group_title(info):
+    """ Quickly extracts the group title from the #EXTINF line without full parsing.
+
+        Used for the early filtering of entries.
+    """
+    start = info.rfind('group-title="')
+    if start < 1 or not info[start - 1].isspace():
+        return None
+    start += 13
+    return normalize_group_title(info[start:info.find('"', start)])
+
+
+def is_compressed(path) -> bool:
+    """ Checks if the playlist file is gzip compressed. """
+    with open(path, "rb") as file:
+        return file.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+
+def open_playlist(path, mode="r"):
+    """ Opens the playlist file. Compressed files are decompressed on the fly. """
+    kwargs = {} if "b" in mode else {"encoding": "utf-8", "errors": "ignore"}
+    if is_compressed(path):
+        return gzip.open(path, mode if "b" in mode else f"{mode}t", **kwargs)
+    return open(path, mode, **kwargs)
+
+
+def get_group_type(name) -> int:
+    """ Returns the group type by the group title -> index in CONTENT_TYPES. """
+    words = name.split()
+    if "VOD" in words:
+        return 1
+    if "SERIES" in words:
+        return 2
+    return 0
+
+
+def get_host(url):
+    """ Returns the host name of the URL without the user info and port. """
+    netloc = url.split("/", 3)[2] if url.count("/") >= 2 else ""
+    netloc = netloc.rpartition("@")[2]
+    if netloc.startswith("["):
+        return netloc[1:netloc.find("]")].lower()
+    return netloc.partition(":")[0].lower()
+
+
+class ContentFilter:
+    """ Provider content filter.
+
+        Applied by the parsers before any channel objects are created,
+        so only the kept content takes up memory and parsing time.
+
+        Rules [dict]:
+            "include-groups": group title globs to keep (all if empty),
+            "exclude-groups": group title globs to skip,
+            "content-types": content types to keep -> CONTENT_TYPES (all if empty),
+            "hide-adult": skip adult content,
+            "hosts": stream URL hosts to keep (all if empty).
+
+        Globs and hosts are case-insensitive. Entries without a group are treated as live content
+        and are skipped if the "include-groups" list is set.
+    """
+
+    def __init__(self, rules=None):
+        rules = rules or {}
+        self.include_groups = self.compile(rules.get("include-groups"))
+        self.exclude_groups = self.compile(rules.get("exclude-groups"))
+        self.content_types = frozenset(rules.get("content-types") or CONTENT_TYPES)
+        self.hide_adult = bool(rules.get("hide-adult", False))
+        self.hosts = frozenset(h.strip().lower() for h in rules.get("hosts") or () if h.strip())
+        # Identifies the rules [e.g. for the catalog snapshots].
+        self.key = json.dumps(rules, sort_keys=True)
+        # Group title -> result. Playlists usually contain many entries per group.
+        self._groups = {}
+
+    def __bool__(self):
+        return any((self.include_groups, self.exclude_groups, self.content_types != frozenset(CONTENT_TYPES),
+                    self.hide_adult, self.hosts))
+
+    @staticmethod
+    def compile(globs):
+        """ Combines the globs into a single regex. """
+        globs = [g.strip() for g in globs or () if g.strip()]
+        return re.compile("|".join(translate(g) for g in globs), re.IGNORECASE) if globs else None
+
+    def accept_type(self, content_type) -> bool:
+        return content_type in self.content_types
+
+    def accept_group(self, title) -> bool:
+        """ Checks the group title [M3U]. The group type and adult content are detected by the title. """
+        accepted = self._groups.get(title)
+        if accepted is None:
+            if title:
+                accepted = all((self.accept_type(CONTENT_TYPES[get_group_type(title)]),
+                                not self.hide_adult or not ADULT.search(title),
+                                not self.include_groups or self.include_groups.match(title),
+                                not self.exclude_groups or not self.exclude_groups.match(title)))
+            else:
+                accepted = self.accept_type(CONTENT_TYPES[0]) and not self.include_groups
+            self._groups[title] = accepted
+        return accepted
+
+    def accept_category(self, name, content_type) -> bool:
+        """ Checks the category [Xtream]. """
+        return all((self.accept_type(content_type),
+                    not self.hide_adult or not ADULT.search(name),
+                    not self.include_groups or self.include_groups.match(name),
+                    not self.exclude_groups or not self.exclude_groups.match(name)))
+
+    def accept_url(self, url) -> bool:
+        return not self.hosts or get_host(url) in self.hosts
+
+
+class EntryParser:
+    """ Turns playlist lines into channel entries.
+
+        Entry -> (id, name, logo, group title, title, url).
+        Entries rejected by the content filter are skipped.
+    """
+
+    def __init__(self, content_filter=None):
+        self._info = None
+        self._filter = content_filter or None
+
+    def feed(self, line):
+        """ Returns an entry when the line completes it, otherwise None. """
+        line = line.strip()
+        if line.startswith("#EXTM3U"):
+            return None
+        if line.startswith("#EXTINF"):
+            self._info = None
+            # Rejected entries are skipped before the full parsing.
+            if self._filter and not self._filter.accept_group(get_group_title(line)):
+                return None
+            info = parse_ext_inf(line)
+            if not self._filter or self._filter.accept_group(info[3]):
+                self._info = info
+            return None
+        if "://" in line and not (line.startswith("#")):
+            info = self._info
+            if info is None:
+                return None
+            name = info[1]
+            if name is None or "***" in name:
+                return None
+            # Only the first URL is used.
+            self._info = None
+            if self._filter and not self._filter.accept_url(line):
+                return None
+            return *info, line
+
+
+def get_chunks(path, count):
+    """ Splits the playlist file into chunks at #EXTINF line boundaries.
+
+        Only for uncompressed files!
+        Returns list of (start, end) file offsets.
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as file:
+        for index in range(1, count):
+            pos = max(size * index // count, bounds[-1])
+            file.seek(pos)
+            while True:
+                data = file.read(SEARCH_BLOCK_SIZE + len(EXT_INF_TAG))
+                found = data.find(b"\n" + EXT_INF_TAG)
+                if found >= 0:
+                    bounds.append(pos + found + 1)
+                    break
+                if len(data) <= len(EXT_INF_TAG):
+                    bounds.append(size)
+                    break
+                pos += SEARCH_BLOCK_SIZE
+                file.seek(pos)
+    bounds.append(size)
+
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def parse_chunk(path, start, end, content_filter=None):
+    """ Parses part of the playlist file. Used in child processes.
+
+        Returns list of entries.
+    """
+    with open(path, "rb") as file:
+        file.seek(start)
+        data = io.BytesIO(file.read(end - start))
+
+    parser = EntryParser(content_filter)
+    with io.TextIOWrapper(data, encoding="utf-8", errors="ignore") as lines:
+        return [e for e in map(parser.feed, lines) if e]
+
+
+def parse_ext_inf_re(info):
+    """ Regex based #EXTINF line parsing. Used as a reference for the benchmark. """
+    ch_id, name, logo, group_title, title = None, None, None, None, None
+
+    match = EXT_INF.fullmatch(info or "")
+    if match:
+        res = match.groupdict()
+        params = dict(PARAMS.findall(res['params']))
+        ch_id = params.get("tvg-id", None)
+        if "tvg-name" in params and params['tvg-name'].strip() != "":
+            name = params['tvg-name'].strip()
+        if "tvg-logo" in params and params['tvg-logo'].strip() != "":
+            logo = params['tvg-logo'].strip()
+        if "group-title" in params and params['group-title'].strip() != "":
+            group_title = params['group-title'].strip().replace(";", " ").replace("  ", " ")
+        title = res['title']
+    if name is None and "," in info:
+        name = info.split(",")[-1].strip()
+
+    return ch_id, name, logo, group_title, title
+
+
+def benchmark(path, repeat=5):
+    """ Compares the #EXTINF tokenizer with the regex based parsing on a real playlist.
+
+        Usage: python3 -m app.m3u <playlist path>
+    """
+    from timeit import timeit
+
+    with open(path, "r", encoding="utf-8", errors="ignore") as file:
+        lines = [line.strip() for line in file if line.startswith("#EXTINF")]
+
+    # Irregular lines.
+    cases = ['#EXTINF:-1\ttvg-id="a"\tgroup-title="g",t',
+             '#EXTINF:-1 tvg-id="a" group-title="Sport  HD",t',
+             '#EXTINF:-1 tvg-name=" " group-title=" A;B ",t',
+             '#EXTINF:10tvg-id="a" x="b"c tvg-name="n",t',
+             '#EXTINF:-1 tvg-id="a"b"c" group-title="g",t',
+             '#EXTINF:-1 tvg-id ="a" tvg-name="n,t',
+             '#EXTINF:,t']
+    mismatches = sum(parse_ext_inf(line) != parse_ext_inf_re(line) for line in cases + lines)
+    re_time = min(timeit(lambda: list(map(parse_ext_inf_re, lines)), number=1) for _ in range(repeat))
+    tk_time = min(timeit(lambda: list(map(parse_ext_inf, lines)), number=1) for _ in range(repeat))
+
+    print(f"Lines: {len(lines)}, mismatches: {mismatches}")
+    print(f"Regex: {re_time:.3f} s, tokenizer: {tk_time:.3f} s, speedup: {re_time / tk_time:.1f}x")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        benchmark(sys.argv[1])
@@ -27,7 +27,10 @@ import os
 import shutil
 import sys
 from datetime import datetime
+from functools import partial
 from itertools import chain
+from queue import Queue
+from threading import Event, Semaphore, get_native_id
 
 import requests
 
@@ -127,18 +130,23 @@ class AppWindow(Adw.ApplicationWindow):
         self.active_group = None
         self.active_serie = None
         self.marked_provider = None
+        self._patched_catalog = None  # The last catalog whose changes have been applied to the opened page.
+        self._indexing_catalog = None  # The catalog whose series index is being built.
         self.content_type = TV_GROUP  # content being browsed
         self.active_channel = None
         self.is_full_screen = False
         self.is_fav_mode = False
         self.player = None
-        self.xtream = None
+        self.xtreams = {}  # Xtream clients by provider name.
         self.search_running = False
         self.current_page = Page.START
         self.ia = None  # IMDb
 
         self._is_tv_mode = True
         self.TV_PAGES = {Page.MOVIES, Page.SERIES, Page.SEARCH, Page.OVERVIEW}
+        # Pages showing the content of the type -> Updated after the provider reload.
+        self.CONTENT_PAGES = {TV_GROUP: {Page.CHANNELS}, MOVIES_GROUP: {Page.MOVIES},
+                              SERIES_GROUP: {Page.MOVIES, Page.SERIES}}
         # Delay before hiding the mouse cursor.
         self._mouse_hide_interval = 5
         self._is_mouse_cursor_hidden = True
@@ -148,6 +156,8 @@ class AppWindow(Adw.ApplicationWindow):
         self._mouse_pos = (0, 0)
         # Used for redownloading timer
         self.reload_timeout_sec = self.settings.get_value("reload-interval")
+        # Max number of providers loaded at the same time.
+        self.max_loading_workers = 4
         # History.
         self.history.is_active = self.settings.get_value("enable-history")
         # Start page.
@@ -285,10 +295,12 @@ class AppWindow(Adw.ApplicationWindow):
         if self._epg_timer_id >= 0:
             GLib.source_remove(self._epg_timer_id)
 
+        # On refresh, the loaded providers are kept, so only the changed parts of their catalogs are updated.
+        providers = {p.get_info(): p for p in self.providers if p.loaded} if refresh else {}
         self.providers = []
         for provider_info in self.settings.get_strv("providers"):
             try:
-                provider = Provider(name=None, provider_info=provider_info)
+                provider = providers.get(provider_info) or Provider(name=None, provider_info=provider_info)
                 # Add provider to list.
                 # This must be done so that it shows up in the list of providers for editing.
                 self.providers.append(provider)
@@ -296,6 +308,8 @@ class AppWindow(Adw.ApplicationWindow):
                 log(e)
                 log("Couldn't parse provider info: ", provider_info)
 
+        self.manager.dedup.sync(p.name for p in self.providers)
+
         if not refresh and page is Page.START:
             self.status(tr("Loading favorites..."))
             self.favorites.set_groups(self.manager.load_favorites())
@@ -319,17 +333,62 @@ class AppWindow(Adw.ApplicationWindow):
     @async_function
     def load_providers(self, refresh=False):
         self.status(tr("Loading providers..."))
-        [self.load_provider(p, refresh) for p in self.providers]
+        # The active provider is always scheduled first.
+        active_name = self.settings.get_string("active-provider")
+        providers = sorted(self.providers, key=lambda p: p.name != active_name)
+        total = len(providers)
+
+        loaded = Queue()
+        self.start_providers_loading(providers, refresh, loaded)
+        for done in range(1, total + 1):
+            provider, error = loaded.get()
+            if error:
+                log(f"{provider.name}: Loading error: {error}")
+
+            if provider is self.active_provider:
+                # Slow providers should not hold back the start page.
+                self.on_active_provider_loaded()
+            if done < total:
+                self.status(f"{tr('Loading providers...')} {done}/{total}")
+            self.refresh_providers_page()
 
         # If there are more than 1 providers and no Active Provider, set to the first one
         if len(self.providers) > 0 and self.active_provider is None:
             self.active_provider = self.providers[0]
+            self.on_active_provider_loaded()
+
+    @async_function
+    def start_providers_loading(self, providers, refresh, loaded: Queue):
+        """ Loads providers in daemon threads [not to delay the exit], max_loading_workers at a time.
 
+            Loaded providers are put into the queue in the completion order.
+        """
+        slots = Semaphore(self.max_loading_workers)
+        for provider in providers:
+            slots.acquire()
+            self.load_provider_in_slot(provider, refresh, slots, loaded)
+
+    @async_function
+    def load_provider_in_slot(self, provider, refresh, slots: Semaphore, loaded: Queue):
+        error = None
+        try:
+            self.load_provider(provider, refresh)
+        except Exception as e:
+            error = e
+        finally:
+            slots.release()
+        loaded.put((provider, error))
+
+    def on_active_provider_loaded(self):
+        GLib.idle_add(self.update_start_page)
+        catalog = self.active_provider.catalog
+        # The catalog [and its diff] is kept as is if the playlist has not been changed since the last reload.
+        if catalog.diff and catalog is not self._patched_catalog:
+            self._patched_catalog = catalog
+            GLib.idle_add(self.update_catalog_changes, self.active_provider)
         if self.active_provider.epg:
             GLib.timeout_add_seconds(2, self.init_epg)
 
-        self.refresh_providers_page()
-
     def load_provider(self, provider, refresh=False):
         if provider.type_id != "xtream":
             # Download M3U
@@ -340,37 +399,84 @@ class AppWindow(Adw.ApplicationWindow):
             ret = self.manager.get_playlist(provider, refresh=refresh)
 
             if ret:
-                self.status(tr("Checking playlist..."), provider)
-                if self.manager.check_playlist(provider):
-                    self.status(tr("Loading channels..."), provider)
-                    self.manager.load_channels(provider)
+                if not provider.loaded or refresh:
+                    self.status(tr("Checking playlist..."), provider)
+                    if self.manager.check_playlist(provider):
+                        self.status(tr("Loading channels..."), provider)
+                        self.manager.load_channels(provider)
+
+                if provider.loaded:
                     self.status(None)
-                    lc, lg, ls = len(provider.channels), len(provider.groups), len(provider.series)
-                    log(f"{p_name}: {lc} channels, {lg} groups, {ls} series, {len(provider.movies)} movies")
+                    catalog = provider.catalog
+                    self.manager.dedup.update(p_name, catalog)
+                    lc, lg, lm = len(catalog.channels), len(catalog.groups), len(catalog.movies)
+                    log(f"{p_name}: {lc} channels, {lg} groups, {lm} movies")
             else:
                 self.status(tr(f"Failed to Download playlist from {p_name}"), provider)
         else:
             # Load xtream class
             from .xtream import XTream
             # Download via Xtream
-            self.xtream = XTream(provider.name, provider.username, provider.password, provider.url,
-                                 hide_adult_content=False, cache_path=PROVIDERS_PATH)
-            if self.xtream.auth_data != {}:
+            xtream = XTream(provider.name, provider.username, provider.password, provider.url,
+                            cache_path=PROVIDERS_PATH, content_filter=self.manager.get_content_filter(provider),
+                            lean=True, lazy=self.settings.get_value("xtream-lazy-loading"))
+            self.xtreams[provider.name] = xtream
+            if xtream.auth_data != {}:
                 log(f"XTREAM `{provider.name}` Loading Channels")
-                # Load data
-                self.xtream.load_iptv()
-                # Inform Provider of data
-                provider.channels = self.xtream.channels
-                provider.movies = self.xtream.movies
-                provider.series = self.xtream.series
-                provider.groups = self.xtream.groups
                 # If no errors, approve provider
                 if provider.name == self.settings.get_string("active-provider"):
                     self.active_provider = provider
+                # Live channels are published first. VOD and series are loaded further in the background.
+                first_loaded = Event()
+                self.load_xtream(provider, xtream, refresh, first_loaded)
+                first_loaded.wait()
                 self.status(None)
             else:
                 log("XTREAM Authentication Failed")
 
+    @async_function
+    def load_xtream(self, provider, xtream, refresh, first_loaded: Event):
+        """ Staged loading of the Xtream provider.
+
+            The catalog is published after each stream type [Live first, then VOD and Series].
+            The first_loaded event is set after the first one.
+        """
+        def on_stage(x, stream_type):
+            if first_loaded.is_set():
+                self.on_xtream_updated(provider, x)
+            else:
+                provider.catalog = Catalog(x.groups, x.channels, x.movies, x.series)
+                log(f"XTREAM `{provider.name}` {stream_type} loaded")
+                first_loaded.set()
+                if IS_LINUX:
+                    # The rest is loaded with lower CPU priority [per thread on Linux], e.g. not to disturb playback.
+                    thread_id = get_native_id()
+                    os.setpriority(os.PRIO_PROCESS, thread_id, max(os.getpriority(os.PRIO_PROCESS, thread_id), 10))
+
+        try:
+            # The stale cache is used at startup and refreshed in the background.
+            update_callback = partial(self.on_xtream_updated, provider, reindex=True)
+            xtream.load_iptv(update_callback=None if refresh else update_callback, stage_callback=on_stage)
+        finally:
+            first_loaded.set()
+
+        # Xtream channels are never shared, so they are indexed [for the duplicates count] once after the last stage.
+        self.manager.dedup.update(provider.name, provider.catalog)
+        self.refresh_providers_page()
+
+    def on_xtream_updated(self, provider, xtream, reindex=False):
+        """ Publishes the loaded or reloaded [after the stale cache refresh] Xtream data.
+
+            Called from the background thread.
+        """
+        provider.catalog = Catalog(xtream.groups, xtream.channels, xtream.movies, xtream.series)
+        if reindex:
+            self.manager.dedup.update(provider.name, provider.catalog)
+        log(f"XTREAM `{provider.name}` Updated")
+        if provider is self.active_provider:
+            GLib.idle_add(self.update_start_page)
+        self.refresh_providers_page()
+
     @async_function
     def reload_provider(self, provider, provider_type):
         self.load_provider(provider, refresh=provider_type is not ProviderType.LOCAL)
@@ -404,23 +510,63 @@ class AppWindow(Adw.ApplicationWindow):
             self.navigation_view.push_by_tag(page)
 
         if page is Page.START:
-            provider = self.active_provider
-            if provider is None:
-                self.tv_label.set_text(tr("TV Channels (0)"))
-                self.movies_label.set_text(tr("Movies (0)"))
-                self.series_label.set_text(tr("Series (0)"))
-                self.tv_button.set_sensitive(False)
-                self.movies_button.set_sensitive(False)
-                self.series_button.set_sensitive(False)
-                self.active_provider_info.set_title(tr("No provider selected"))
+            self.update_start_page()
+
+    def update_start_page(self):
+        provider = self.active_provider
+        if provider is None:
+            self.tv_label.set_text(tr("TV Channels (0)"))
+            self.movies_label.set_text(tr("Movies (0)"))
+            self.series_label.set_text(tr("Series (0)"))
+            self.tv_button.set_sensitive(False)
+            self.movies_button.set_sensitive(False)
+            self.series_button.set_sensitive(False)
+            self.active_provider_info.set_title(tr("No provider selected"))
+        else:
+            catalog = provider.catalog
+            # Lazy loading [Xtream] -> Only the categories are known until they are opened.
+            xtream = self.xtreams.get(provider.name) if provider.type_id == "xtream" else None
+            if xtream and xtream.lazy:
+                lazy_types = {g.group_type for g in catalog.groups if not g.channels and not g.series}
             else:
-                self.tv_label.set_text(tr(f"TV Channels ({len(provider.channels)})"))
-                self.movies_label.set_text(tr(f"Movies ({len(provider.movies)})"))
-                self.series_label.set_text(tr(f"Series ({len(provider.series)})"))
-                self.tv_button.set_sensitive(len(provider.channels) > 0)
-                self.movies_button.set_sensitive(len(provider.movies) > 0)
-                self.series_button.set_sensitive(len(provider.series) > 0)
-                self.active_provider_info.set_title(provider.name)
+                lazy_types = set()
+            for label, button, title, count, group_type in (
+                    (self.tv_label, self.tv_button, "TV Channels", len(catalog.channels), TV_GROUP),
+                    (self.movies_label, self.movies_button, "Movies", len(catalog.movies), MOVIES_GROUP)):
+                if count or group_type not in lazy_types:
+                    label.set_text(tr(f"{title} ({count})"))
+                else:
+                    label.set_text(f"{tr(title)} (...)")
+                button.set_sensitive(count > 0 or group_type in lazy_types)
+
+            if catalog.series_ready:
+                if catalog.series or SERIES_GROUP not in lazy_types:
+                    self.series_label.set_text(tr(f"Series ({len(catalog.series)})"))
+                else:
+                    self.series_label.set_text(f"{tr('Series')} (...)")
+                self.series_button.set_sensitive(len(catalog.series) > 0 or SERIES_GROUP in lazy_types)
+            else:
+                # The button is enabled when the series index is built in the background.
+                self.series_label.set_text(f"{tr('Series')} (...)")
+                self.series_button.set_sensitive(False)
+                self.index_series(provider)
+            self.active_provider_info.set_title(provider.name)
+
+    def index_series(self, provider: Provider):
+        """ Builds the series index of the provider step by step with low priority. """
+        catalog = provider.catalog
+        if catalog.series_ready or catalog is self._indexing_catalog:
+            return
+        self._indexing_catalog = catalog
+
+        def index():
+            yield from catalog.index_series()
+            if provider is self.active_provider:
+                self.update_start_page()
+            yield False
+
+        gen = index()
+        GLib.idle_add(lambda: next(gen, False), priority=GLib.PRIORITY_LOW)
 
     def on_start_page_showing(self, page: Adw.NavigationPage):
         self.history.update_channels()
@@ -449,18 +595,25 @@ class AppWindow(Adw.ApplicationWindow):
         found_groups = False
 
         self.categories_flowbox.remove_all()
+        catalog = self.active_provider.catalog
+        if content_type == SERIES_GROUP and not catalog.series_ready:
+            # The series index is not built yet -> Building it right now.
+            series = catalog.series
+            log(f"{self.active_provider.name}: {len(series)} series")
 
-        for group in self.active_provider.groups:
+        for group in catalog.groups:
             if group.group_type != self.content_type:
                 continue
             found_groups = True
 
             if self.content_type == TV_GROUP:
-                label = f"{group.name} ({len(group.channels)})"
+                label, count = group.name, len(group.channels)
             elif self.content_type == MOVIES_GROUP:
-                label = f"{self.remove_word('VOD', group.name)} ({len(group.channels)})"
+                label, count = self.remove_word('VOD', group.name), len(group.channels)
             else:
-                label = f"{self.remove_word('SERIES', group.name)} ({len(group.series)})"
+                label, count = self.remove_word('SERIES', group.name), len(group.series)
+            # No count -> Empty or not loaded yet [lazy loading].
+            label = f"{label} ({count})" if count else label
 
             name = group.name.lower().replace("(", " ").replace(")", " ")
             self.categories_flowbox.append(GroupWidget(group, label, self.get_badge_pixbuf(name)))
@@ -472,6 +625,38 @@ class AppWindow(Adw.ApplicationWindow):
         group = group_widget.data if group_widget else None
         self.active_group = group
 
+        xtream = self.xtreams.get(self.active_provider.name) if group else None
+        if xtream and xtream.lazy:
+            self.load_xtream_category(self.active_provider, xtream, group)
+        else:
+            self.show_group(group)
+
+    @async_function
+    def load_xtream_category(self, provider, xtream, group):
+        """ Loads the streams of the opened category on demand and prefetches the neighbouring ones. """
+        if not xtream.is_category_loaded(group):
+            self.status(tr("Loading channels..."), provider)
+            if not xtream.load_category(group):
+                self.status(tr(f"Failed to load {group.name}"), provider)
+                return
+            self.status(None)
+
+        xtream.prefetch_neighbours(group)
+        if provider.catalog.groups != tuple(xtream.groups):
+            # New groups with the streams of the opened or prefetched categories.
+            self.on_xtream_updated(provider, xtream)
+        GLib.idle_add(self.show_loaded_group, group, xtream.get_group(group) or group)
+
+    def show_loaded_group(self, group, loaded_group):
+        """ Shows the group that replaced the opened one after loading its streams [lazy loading]. """
+        if group is self.active_group:
+            self.active_group = loaded_group
+            self.show_group(loaded_group)
+
+    def show_group(self, group):
+        if group is not self.active_group:
+            return
+
         if self.content_type == TV_GROUP:
             title = tr("Channels")
             self.channels_page.set_title(f"{title} [{group.name}]" if group else title)
@@ -504,10 +689,15 @@ class AppWindow(Adw.ApplicationWindow):
             num = len(provider.movies)
             if num > 0:
                 labels.append(gettext.ngettext("%d movie", "%d movies", num) % num)
-            num = len(provider.series)
+            # The series index is not built here for all providers.
+            num = len(provider.series) if provider.catalog.series_ready else 0
             if num > 0:
                 labels.append(gettext.ngettext("%d series", "%d series", num) % num)
 
+            num = self.manager.dedup.get_duplicates(provider.name)
+            if num > 0:
+                labels.append(gettext.ngettext("%d duplicate", "%d duplicates", num) % num)
+
             if provider == self.active_provider:
                 labels.append("%s %d (active)" % (provider.name, len(provider.channels)))
             else:
@@ -552,6 +742,7 @@ class AppWindow(Adw.ApplicationWindow):
         def clb(resp):
             if resp:
                 self.providers.remove(widget.provider)
+                self.manager.dedup.remove(widget.provider.name)
                 self.providers_list.remove(widget)
                 self.settings.set_strv("providers", [provider.get_info() for provider in self.providers])
 
@@ -634,6 +825,71 @@ class AppWindow(Adw.ApplicationWindow):
             self.download_channel_logos(logos_to_refresh)
         yield True
 
+    def update_catalog_changes(self, provider: Provider):
+        """ Updates the opened channel, movie or series list after the provider reload. """
+        if provider is not self.active_provider or self.current_page not in self.CONTENT_PAGES[self.content_type]:
+            return
+
+        catalog = provider.catalog
+        group = self.active_group
+        if group:
+            if group.name not in catalog.diff.groups:
+                return
+            group = next((g for g in catalog.groups if g.name == group.name), None)
+            self.active_group = group
+            if group is None:
+                # The opened group has been removed -> Back to the groups.
+                self.navigation_view.pop_to_tag(Page.CATEGORIES)
+                return
+
+        if self.content_type == TV_GROUP:
+            channels = group.channels if group else catalog.channels
+            gen = self.patch_channels_data(channels, self.channels_list_box)
+            GLib.idle_add(lambda: next(gen, False), priority=GLib.PRIORITY_LOW)
+        elif self.content_type == MOVIES_GROUP:
+            self.update_movies_page(group.channels if group else catalog.movies)
+        else:
+            # The series index of the new catalog is built right now.
+            series = catalog.series
+            if self.current_page is Page.MOVIES:
+                self.update_movies_page(group.series if group else series)
+                return
+
+            serie = next((s for s in series if s.name == self.active_serie.name), None)
+            if serie is None:
+                # The opened series has been removed.
+                self.navigation_view.pop()
+            else:
+                self.active_serie = serie
+                self.update_series_page(serie)
+
+    def patch_channels_data(self, channels: list, ch_box: Gtk.ListBox):
+        """ Removes rows of the missing channels and adds rows only for the new ones. """
+        actual = set(channels)
+        present = set()
+        row = ch_box.get_first_child()
+        while row:
+            next_row = row.get_next_sibling()
+            if row.channel in actual:
+                present.add(row.channel)
+            else:
+                ch_box.remove(row)
+            row = next_row
+        yield True
+
+        logos_to_refresh = []
+        added = 0
+        for index, ch in enumerate(channels):
+            if ch not in present:
+                ch_box.insert(ChannelWidget.get_widget(ch, logos_to_refresh, self.favorites.is_favorite(ch)), index)
+                added += 1
+                if added % 50 == 0:
+                    yield True
+
+        if len(logos_to_refresh) > 0:
+            self.download_channel_logos(logos_to_refresh)
+        yield True
+
     def on_previous_channel(self, button=None):
         if self.current_page is Page.CHANNELS and self.is_tv_mode:
             self.on_playback_backward()
@@ -675,8 +931,11 @@ class AppWindow(Adw.ApplicationWindow):
     # ******************** Movies ******************** #
 
     def show_movies(self, items):
-        logos_to_refresh = []
         self.navigate_to(Page.MOVIES)
+        self.update_movies_page(items)
+
+    def update_movies_page(self, items):
+        logos_to_refresh = []
         self.movies_flowbox.remove_all()
 
         for item in items:
@@ -704,15 +963,18 @@ class AppWindow(Adw.ApplicationWindow):
     # ******************** Series ******************** #
 
     def show_series(self, serie: Serie):
-        logos_to_refresh = []
         self.active_serie = serie
         # If we are using xtream provider
         # Load every Episodes of every Season for this Series
         if self.active_provider.type_id == "xtream":
-            self.xtream.get_series_info_by_id(self.active_serie)
+            self.xtreams[self.active_provider.name].get_series_info_by_id(self.active_serie)
 
-        self.series_list.remove_all()
         self.navigate_to(Page.SERIES)
+        self.update_series_page(serie)
+
+    def update_series_page(self, serie: Serie):
+        logos_to_refresh = []
+        self.series_list.remove_all()
 
         for season_name in serie.seasons.keys():
             season = serie.seasons[season_name]
@@ -1019,7 +1281,8 @@ class AppWindow(Adw.ApplicationWindow):
 
         found = []
 
-        for ch in chain(self.active_provider.channels, self.active_provider.movies, self.active_provider.series):
+        catalog = self.active_provider.catalog
+        for ch in chain(catalog.channels, catalog.movies, catalog.series):
             if txt in ch.name.upper():
                 found.append(ch)
             yield self.search_running
@@ -41,6 +41,10 @@ class Defaults(dict):
         self["reload-interval"] = 3600  # 1 Hour
         self["dark-mode"] = False  # 1 Hour
         self["enable-history"] = True
+        # Provider name -> content filter rules [m3u.ContentFilter].
+        self["provider-filters"] = {}
+        # Xtream providers -> Only the categories are loaded at startup, the streams when a category is opened.
+        self["xtream-lazy-loading"] = False
 
 
 class Language(StrEnum):
@@ -22,89 +22,408 @@ Github: DYefremov
 __version__ = '0.5.0'
 __author__ = 'Claudio Olmi'
 
+import glob
 import json
+import mmap
 import re  # used for URL validation
+import struct
 import time
-from os import makedirs
+from concurrent.futures import Future, wait
+from copy import copy
+from itertools import chain
+from threading import Condition, Lock, Thread
+from os import makedirs, remove, replace, stat
 from os import path as osp
 from timeit import default_timer as timer  # Timing xtream json downloads
 from typing import List, Tuple
+from urllib.parse import parse_qs, urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .common import StringTable, log
+from .m3u import CONTENT_TYPES, ContentFilter
+
+
+# Channel attributes required by TVDemon.
+CHANNEL_FIELDS = ("id", "name", "logo", "logo_path", "group_title", "title", "url")
+# Size of the blocks for the streaming download and JSON decoding.
+CHUNK_SIZE = 1024 * 1024  # 1 MB
+# URL validation. Compiled once!
+URL_REGEX = re.compile(
+    r'^(?:http|ftp)s?://'  # http:// or https://
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain...
+    r'localhost|'  # localhost...
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # ...or ip
+    r'(?::\d+)?'  # optional port
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+
+# Whitespace and separators between the JSON array items.
+JSON_SEP = re.compile(r"[\s,]*")
+JSON_WS = re.compile(r"\s*")
+
+# Binary stream cache [*.bin] -> Header, string heap [UTF-8], fixed-width records.
+# Each version of the source JSON file gets its own cache file -> The mapped files are never replaced.
+CACHE_MAGIC = b"TVDX"
+CACHE_VERSION = 2
+# Magic, version, flags, record count, records offset, size and mtime [ns] of the source JSON file.
+CACHE_HEADER = struct.Struct("<4sHBxIQqq")
+# The raw JSON of the streams is stored [not in the lean mode].
+CACHE_RAW = 1
+# Stream fields stored in the cache. Fields with the same index are used in the same way.
+STREAM_FIELDS = ("stream_id", "name", "stream_icon", "category_id", "stream_type", "container_extension",
+                 "epg_channel_id", "added")
+SERIES_FIELDS = ("series_id", "name", "cover", "category_id", "plot", "youtube_trailer", "genre", "last_modified")
+ID, NAME, LOGO, CATEGORY_ID, STREAM_TYPE, EXTENSION, EPG_CHANNEL_ID, ADDED = range(len(STREAM_FIELDS))
+PLOT, YOUTUBE_TRAILER, GENRE = range(4, 7)
+# The raw JSON of the stream follows the fields.
+RAW = len(STREAM_FIELDS)
+# Record -> (offset, length) in the heap for each field and the raw JSON, adult flag.
+CACHE_RECORD = struct.Struct(f"<{(RAW + 1) * 2}IB3x")
+STRING_REF = struct.Struct("<II")
+
+
+def iter_json_array(file, chunk_size: int = CHUNK_SIZE):
+    """Decode a JSON array from the file incrementally
+
+    Only one chunk of the text and one decoded item are held at the same time,
+    so the memory doesn't depend on the array size.
+
+    Args:
+        file: Text file object
+        chunk_size (int, optional): Size of the chunks to read. Defaults to CHUNK_SIZE.
+
+    Yields:
+        Items of the array. Nothing if the JSON data is not an array (e.g. an empty object).
+    """
+    # The items are written to the stream cache and dropped, so the keys are not shared between them.
+    decoder = json.JSONDecoder()
+    buffer = ""
+    while not buffer:
+        data = file.read(chunk_size)
+        if not data:
+            return
+        buffer = data.lstrip()
+
+    if not buffer.startswith("["):
+        # Not an array -> Provider error or no content.
+        data = json.loads(buffer + file.read())
+        if isinstance(data, list):
+            yield from data
+        return
+
+    pos, eof = 1, False
+    while True:
+        pos = JSON_SEP.match(buffer, pos).end()
+        if buffer.startswith("]", pos):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            item, end = None, -1
+        # The item may be incomplete at the end of the chunk (e.g. a number) -> It must be followed by a separator.
+        if end >= 0 and not eof:
+            after = JSON_WS.match(buffer, end).end()
+            end = end if after < len(buffer) and buffer[after] in ",]" else -1
+        if end < 0:
+            if eof:
+                raise ValueError("Unexpected end of JSON data")
+            data = file.read(chunk_size)
+            buffer, pos, eof = buffer[pos:] + data, 0, not data
+            continue
+
+        pos = end
+        yield item
+
+
+def run_on_daemon_threads(func, calls: list, max_workers: int) -> list:
+    """Run the calls concurrently on daemon threads
+
+    Unlike the ThreadPoolExecutor workers, the threads are not joined at the interpreter exit,
+    so the pending downloads don't hold back the application exit.
+
+    Args:
+        func: Function to call
+        calls (list): Arguments of each call
+        max_workers (int): Max number of threads
+
+    Returns:
+        list: Future with the result for each call
+    """
+    jobs = [(Future(), args) for args in calls]
+    pending = iter(jobs)
+    lock = Lock()
+
+    def work():
+        while True:
+            with lock:
+                future, args = next(pending, (None, None))
+            if future is None:
+                return
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+    for __ in range(min(max_workers, len(jobs))):
+        Thread(target=work, daemon=True).start()
+
+    return [f for f, a in jobs]
+
+
+class StreamCache:
+    """Binary, memory-mapped cache of a stream list
+
+    Built once from the downloaded JSON file. The records are fixed-width, so any record is
+    found by its index. Strings are decoded only on access, and the model objects are views
+    of the records -> Nothing is decoded until the streams are shown.
+    """
+
+    def __init__(self, path: str):
+        """Open the cache file
+
+        Args:
+            path (str): Path of the cache file
+
+        Raises:
+            ValueError: If the file is not a valid cache
+        """
+        with open(path, mode='rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._map) < CACHE_HEADER.size:
+                raise ValueError("Unsupported cache file")
+            magic, version, flags, self.count, self._records, self.source_size, self.source_mtime = \
+                CACHE_HEADER.unpack_from(self._map)
+            self.has_raw = bool(flags & CACHE_RAW)
+            if any((magic != CACHE_MAGIC, version != CACHE_VERSION,
+                    self._records + self.count * CACHE_RECORD.size != len(self._map))):
+                raise ValueError("Unsupported cache file")
+        except ValueError:
+            self.close()
+            raise
+
+    def __len__(self):
+        return self.count
+
+    def get(self, index: int, field: int) -> str:
+        """Get the field value of the record
+
+        Args:
+            index (int): Record index
+            field (int): Field index -> STREAM_FIELDS, SERIES_FIELDS
+
+        Returns:
+            str: Value of the field. Empty string if the stream has no such field.
+        """
+        offset, length = STRING_REF.unpack_from(self._map, self._records + index * CACHE_RECORD.size + field * 8)
+        return self._map[offset:offset + length].decode("utf-8")
+
+    def is_adult(self, index: int) -> bool:
+        """Check the adult flag of the record
+
+        Args:
+            index (int): Record index
+
+        Returns:
+            bool: True if the stream is marked as adult content
+        """
+        return bool(self._map[self._records + (index + 1) * CACHE_RECORD.size - 4])
+
+    def get_raw(self, index: int, fields: tuple) -> dict:
+        """Get the raw JSON data of the stream
+
+        Args:
+            index (int): Record index
+            fields (tuple): Stored fields -> STREAM_FIELDS, SERIES_FIELDS
+
+        Returns:
+            dict: Stream data as received from the provider. Only the stored fields if the raw JSON is not stored.
+        """
+        if self.has_raw:
+            return json.loads(self.get(index, RAW))
+        return {f: v for f, v in zip(fields, (self.get(index, i) for i in range(len(fields)))) if v}
+
+    def get_string(self, record: tuple, field: int) -> str:
+        """Get the field value of the unpacked record
+
+        Args:
+            record (tuple): Record from iter_records
+            field (int): Field index
+
+        Returns:
+            str: Value of the field
+        """
+        offset = record[field * 2]
+        return self._map[offset:offset + record[field * 2 + 1]].decode("utf-8")
+
+    def iter_records(self):
+        """Iterate over the unpacked records
+
+        Returns:
+            Iterator of tuples -> (offset, length) for each field and the raw JSON, adult flag
+        """
+        return CACHE_RECORD.iter_unpack(self._map[self._records:])
+
+    def close(self):
+        """Unmap the cache file
+
+        The mapping holds its own file descriptor until it is closed.
+        The streams of the cache can't be accessed after that.
+        """
+        self._map.close()
+
+    @staticmethod
+    def write(path: str, items, fields: tuple, source_size: int, source_mtime: int, raw: bool = True) -> int:
+        """Write the cache file
 
-from .common import log
+        Args:
+            path (str): Path of the cache file. It is replaced when complete.
+            items: Stream dictionaries
+            fields (tuple): Fields to store -> STREAM_FIELDS, SERIES_FIELDS
+            source_size (int): Size of the source JSON file
+            source_mtime (int): Modification time of the source JSON file [ns]
+            raw (bool, optional): Store the raw JSON of the streams. Defaults to True.
 
+        Returns:
+            int: Number of records
+        """
+        # Repeated values [logos, categories, types] are stored once.
+        strings = {}
+        get_string = strings.get
+        encode = json.JSONEncoder(ensure_ascii=False).encode
+        pack = CACHE_RECORD.pack
+        heap = bytearray()
+        records = bytearray()
+        count = 0
+        offset = CACHE_HEADER.size
+
+        with open(f"{path}.part", mode='wb') as file:
+            file.write(bytes(offset))
+
+            for item in items:
+                values = []
+                for field in fields:
+                    value = item.get(field)
+                    value = "" if value is None else str(value)
+                    ref = get_string(value)
+                    if ref is None:
+                        data = value.encode("utf-8")
+                        ref = strings[value] = (offset + len(heap), len(data))
+                        heap += data
+                    values += ref
+
+                if raw:
+                    data = encode(item).encode("utf-8")
+                    values += (offset + len(heap), len(data))
+                    heap += data
+                else:
+                    values += (0, 0)
+                records += pack(*values, str(item.get("is_adult")) == "1")
+                count += 1
+
+                if len(heap) > CHUNK_SIZE:
+                    file.write(heap)
+                    offset += len(heap)
+                    heap.clear()
+
+            file.write(heap)
+            offset += len(heap)
+            file.write(records)
+            file.seek(0)
+            flags = CACHE_RAW if raw else 0
+            file.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, flags, count, offset, source_size, source_mtime))
+
+        replace(f"{path}.part", path)
+        return count
+
+
+class LazyLogo:
+    """ Resolves the local logo path on the first access. """
+    __slots__ = ()
+    _logo_path = ""
+    # Not None -> The logo path is not resolved yet.
+    _xtream = None
+
+    @property
+    def logo_path(self):
+        if self._xtream:
+            self._logo_path, self._xtream = self._xtream._get_logo_local_path(self.logo), None
+        return self._logo_path
+
+
+class Channel(LazyLogo):
+    """Live or VOD stream
+
+    View of the stream cache record. The fields are decoded on access.
+    """
+    __slots__ = ("_cache", "_index", "_url_prefix", "_logo_path", "_xtream", "group_title")
+
+    def __init__(self, xtream: object, group_title, cache: StreamCache, index: int, url_prefix: str):
+        self._cache = cache
+        self._index = index
+        # URL -> Shared prefix [server/stream_type/username/password/] + stream_id.extension
+        self._url_prefix = url_prefix
+        self._logo_path = ""
+        self._xtream = xtream
+        # Required by TVDemon
+        self.group_title = group_title
 
-class Channel:
     # Required by TVDemon
-    id = ""
-    name = ""  # What is the difference between the below name and title?
-    logo = ""
-    logo_path = ""
-    group_title = ""
-    title = ""
-    url = ""
-    # XTream
-    stream_type = ""
-    group_id = ""
-    is_adult = 0
-    added = ""
-    epg_channel_id = ""
-    added = ""
-    # This contains the raw JSON data
-    raw = ""
+    @property
+    def id(self):
+        return self._cache.get(self._index, ID)
+
+    @property
+    def name(self):
+        return self._cache.get(self._index, NAME)
+
+    @property
+    def title(self):
+        return self.name
+
+    @property
+    def logo(self):
+        return self._cache.get(self._index, LOGO)
 
-    def __init__(self, xtream: object, group_title, stream_info):
-        stream_type = stream_info['stream_type']
+    @property
+    def url(self):
+        stream_type = self.stream_type
+        extension = "ts" if stream_type == "live" else self._cache.get(self._index, EXTENSION)
+        return f"{self._url_prefix}{self.id}.{extension}"
+
+    # XTream
+    @property
+    def stream_type(self):
+        stream_type = self._cache.get(self._index, STREAM_TYPE)
         # Adjust the odd "created_live" type
-        if stream_type == "created_live" or stream_type == "radio_streams":
-            stream_type = "live"
+        return "live" if stream_type in ("created_live", "radio_streams") else stream_type
 
-        if stream_type != "live" and stream_type != "movie":
-            log("Error the channel has unknown stream type `{}`\n`{}`".format(stream_type, stream_info))
-        else:
-            # Raw JSON Channel
-            self.raw = stream_info
-            stream_name = stream_info['name']
-            # Required by TVDemon
-            self.id = stream_info['stream_id']
-            self.name = stream_name
-            self.logo = stream_info['stream_icon']
-            self.logo_path = xtream._get_logo_local_path(self.logo)
-            self.group_title = group_title
-            self.title = stream_name
-
-            # Check if category_id key is available
-            if "category_id" in stream_info.keys():
-                self.group_id = int(stream_info['category_id'])
-
-            if stream_type == "live":
-                stream_extension = "ts"
-
-                # Default to 0
-                self.is_adult = 0
-                # Check if is_adult key is available
-                if "is_adult" in stream_info.keys():
-                    self.is_adult = int(stream_info['is_adult'])
-
-                # Check if epg_channel_id key is available
-                if "epg_channel_id" in stream_info.keys():
-                    self.epg_channel_id = stream_info['epg_channel_id']
-
-                self.added = stream_info['added']
-
-            elif stream_type == "movie":
-                stream_extension = stream_info['container_extension']
-            # Required by TVDemon
-            self.url = "{}/{}/{}/{}/{}.{}".format(xtream.server, stream_info['stream_type'],
-                                                  xtream.authorization['username'],
-                                                  xtream.authorization['password'],
-                                                  stream_info['stream_id'],
-                                                  stream_extension)
-
-            # Check that the constructed URL is valid
-            if not xtream._validate_url(self.url):
-                log(f"{self.name} - Bad URL? `{self.url}`")
+    @property
+    def group_id(self):
+        category_id = self._cache.get(self._index, CATEGORY_ID)
+        return int(category_id) if category_id.isdecimal() else ""
+
+    @property
+    def is_adult(self):
+        return int(self._cache.is_adult(self._index)) if self.stream_type == "live" else 0
+
+    @property
+    def added(self):
+        return self._cache.get(self._index, ADDED)
+
+    @property
+    def epg_channel_id(self):
+        return self._cache.get(self._index, EPG_CHANNEL_ID)
+
+    @property
+    def raw(self):
+        """ The raw JSON data. Lean mode -> Only the cached fields. Extra VOD metadata -> XTream.vodInfoByID. """
+        return self._cache.get_raw(self._index, STREAM_FIELDS)
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in CHANNEL_FIELDS}
 
     def export_json(self):
         json_data = {'url': self.url}
@@ -147,7 +466,7 @@ class Group:
             self.group_id = int(group_info['category_id'])
 
 
-class Episode:
+class Episode(LazyLogo):
     # Required by TVDemon
     title = ""
     name = ""
@@ -157,7 +476,8 @@ class Episode:
 
     def __init__(self, xtream: object, series_info, group_title, episode_info) -> None:
         # Raw JSON Episode
-        self.raw = episode_info
+        if not xtream.lean:
+            self.raw = episode_info
 
         self.title = episode_info['title']
         self.name = self.title
@@ -167,61 +487,68 @@ class Episode:
         self.episode_number = episode_info['episode_num']
         self.av_info = episode_info['info']
 
-        self.logo = series_info['cover']
-        self.logo_path = xtream._get_logo_local_path(self.logo)
+        self.logo = xtream.strings.intern(series_info['cover'])
+        self._xtream = xtream
 
-        self.url = "{}/series/{}/{}/{}.{}".format(
-            xtream.server,
-            xtream.authorization['username'],
-            xtream.authorization['password'],
-            self.id,
-            self.container_extension
-        )
+        self._url_prefix = xtream.get_url_prefix("series")
+        self._url = f"{self.id}.{self.container_extension}"
 
-        # Check that the constructed URL is valid
-        if not xtream._validate_url(self.url):
-            log(f"{self.name} - Bad URL? `{self.url}`")
+    @property
+    def url(self):
+        return f"{self._url_prefix}{self._url}"
 
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in CHANNEL_FIELDS}
 
-class Serie:
-    # Required by TVDemon
-    name = ""
-    logo = ""
-    logo_path = ""
 
-    # XTream
-    series_id = ""
-    plot = ""
-    youtube_trailer = ""
-    genre = ""
+class Serie(LazyLogo):
+    """Series
 
-    # This contains the raw JSON data
-    raw = ""
+    View of the stream cache record. The fields are decoded on access.
+    Seasons and episodes are loaded on demand -> XTream.get_series_info_by_id.
+    """
+    __slots__ = ("_cache", "_index", "_logo_path", "_xtream", "seasons", "episodes")
 
-    def __init__(self, xtream: object, series_info):
-        # Raw JSON Series
-        self.raw = series_info
-
-        # Required by TVDemon
-        self.name = series_info['name']
-        self.logo = series_info['cover']
-        self.logo_path = xtream._get_logo_local_path(self.logo)
+    def __init__(self, xtream: object, cache: StreamCache, index: int):
+        self._cache = cache
+        self._index = index
+        self._logo_path = ""
+        self._xtream = xtream
 
         self.seasons = {}
         self.episodes = {}
 
-        # Check if category_id key is available
-        if "series_id" in series_info.keys():
-            self.series_id = int(series_info["series_id"])
-        # Check if plot key is available
-        if "plot" in series_info.keys():
-            self.plot = series_info["plot"]
-        # Check if youtube_trailer key is available
-        if "youtube_trailer" in series_info.keys():
-            self.youtube_trailer = series_info["youtube_trailer"]
-        # Check if genre key is available
-        if "genre" in series_info.keys():
-            self.genre = series_info["genre"]
+    # Required by TVDemon
+    @property
+    def name(self):
+        return self._cache.get(self._index, NAME)
+
+    @property
+    def logo(self):
+        return self._cache.get(self._index, LOGO)
+
+    # XTream
+    @property
+    def series_id(self):
+        series_id = self._cache.get(self._index, ID)
+        return int(series_id) if series_id.isdecimal() else ""
+
+    @property
+    def plot(self):
+        return self._cache.get(self._index, PLOT)
+
+    @property
+    def youtube_trailer(self):
+        return self._cache.get(self._index, YOUTUBE_TRAILER)
+
+    @property
+    def genre(self):
+        return self._cache.get(self._index, GENRE)
+
+    @property
+    def raw(self):
+        """ The raw JSON data. Lean mode -> Only the cached fields. """
+        return self._cache.get_raw(self._index, SERIES_FIELDS)
 
 
 class Season:
@@ -253,10 +580,19 @@ class XTream:
 
     state = {'authenticated': False, 'loaded': False}
     hide_adult_content = False
-    catch_all_group = Group({"category_id": "9999", "category_name": "xEverythingElse", "parent_id": 0}, "")
+    # Keep only the stream fields used by TVDemon [no raw JSON].
+    lean = False
+    # Load only the categories. The streams of a category are loaded when it is opened.
+    lazy = False
     # If the cached JSON file is older than threshold_time_sec then load a new
     # JSON dictionary from the provider
     threshold_time_sec = 60 * 60 * 8
+    # Categories and streams of all types are fetched concurrently [3 types * 2 requests].
+    max_fetch_workers = 6
+    max_retries = 3
+    # Neighbouring categories loaded in the background [lazy mode].
+    max_prefetch_workers = 2
+    prefetch_distance = 2
 
     def __init__(self,
                  provider_name: str,
@@ -264,7 +600,10 @@ class XTream:
                  provider_password: str,
                  provider_url: str,
                  hide_adult_content: bool = False,
-                 cache_path: str = ""
+                 cache_path: str = "",
+                 content_filter: ContentFilter = None,
+                 lean: bool = False,
+                 lazy: bool = False
                  ):
         """Initialize Xtream Class
 
@@ -275,6 +614,11 @@ class XTream:
             provider_url      (str):            URL of the IPTV provider
             hide_adult_content(bool):           When `True` hide stream that are marked for adult
             cache_path        (str, optional):  Location where to save loaded files. Defaults to empty string.
+            content_filter    (ContentFilter, optional): Categories and streams to skip while loading.
+            lean              (bool, optional): When `True` keep only the stream fields used by TVDemon.
+                                                Extra VOD metadata can be fetched with vodInfoByID.
+            lazy              (bool, optional): When `True` load only the categories at startup.
+                                                The streams are loaded by category -> load_category.
 
         Returns: XTream Class Instance
 
@@ -286,8 +630,31 @@ class XTream:
         self.username = provider_username
         self.password = provider_password
         self.name = provider_name
+        self.slug = self._slugify(provider_name)
         self.cache_path = cache_path
-        self.hide_adult_content = hide_adult_content
+        self.content_filter = content_filter or ContentFilter()
+        self.hide_adult_content = hide_adult_content or self.content_filter.hide_adult
+        self.lean = lean
+        self.lazy = lazy
+        # Category key -> Future with the result of the streams loading [lazy mode].
+        self._category_loads = {}
+        self._category_lock = Lock()
+        # Categories waiting for the prefetch and the number of the prefetch threads [lazy mode].
+        self._prefetch_queue = []
+        self._prefetch_workers = 0
+        self._prefetch_done = Condition(self._category_lock)
+        # Instance data. Several providers can be loaded at the same time!
+        self.auth_data = {}
+        self.authorization = {}
+        self.groups = []
+        self.channels = []
+        self.series = []
+        self.movies = []
+        self.state = {'authenticated': False, 'loaded': False}
+        # Repeated strings (logos, URL prefixes) are shared between streams.
+        self.strings = StringTable()
+        # Keep-alive connections are reused by all requests to the provider.
+        self.session = self._create_session()
 
         # if the cache_path is specified, test that it is a directory
         if self.cache_path != "":
@@ -359,16 +726,38 @@ class XTream:
         """
         return "".join(x.lower() for x in string if x.isprintable())
 
-    def _validate_url(self, url: str) -> bool:
-        regex = re.compile(
-            r'^(?:http|ftp)s?://'  # http:// or https://
-            r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'  # domain...
-            r'localhost|'  # localhost...
-            r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # ...or ip
-            r'(?::\d+)?'  # optional port
-            r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+    @staticmethod
+    def _validate_url(url: str) -> bool:
+        return URL_REGEX.match(url) is not None
+
+    def validate_streams(self) -> int:
+        """Deep validation of all stream URLs
+
+        Not used while loading. The stream URLs are built from the validated server URL
+        and the stream IDs, so they are trusted.
+
+        Returns:
+            int: Number of bad URLs
+        """
+        count = 0
+        for stream in chain(self.channels, self.movies):
+            if not self._validate_url(stream.url):
+                log(f"{stream.name} - Bad URL? `{stream.url}`")
+                count += 1
+        return count
+
+    def get_url_prefix(self, stream_type: str) -> str:
+        """Get the shared part of the stream URLs
+
+        Args:
+            stream_type (str): Stream type in the URL -> live, movie, series
 
-        return re.match(regex, url) is not None
+        Returns:
+            str: server/stream_type/username/password/
+        """
+        return self.strings.intern("{}/{}/{}/{}/".format(self.server, stream_type,
+                                                         self.authorization['username'],
+                                                         self.authorization['password']))
 
     def _get_logo_local_path(self, logo_url: str) -> str:
         """Convert the Logo URL to a local Logo Path
@@ -380,10 +769,11 @@ class XTream:
             [type]: The logo path as a string or None
         """
         local_logo_path = None
+        # The logo URL is only used for the download, so a cheap check is enough.
         if logo_url:
-            if self._validate_url(logo_url):
+            if logo_url.startswith(("http://", "https://")):
                 local_logo_path = osp.join(self.cache_path, "{}-{}".format(
-                    self._slugify(self.name),
+                    self.slug,
                     self._slugify(osp.split(logo_url)[-1])))
         return local_logo_path
 
@@ -396,7 +786,7 @@ class XTream:
             self.auth_data = {}
             try:
                 # Request authentication, wait 4 seconds maximum
-                r = requests.get(self.get_authenticate_url(), timeout=4)
+                r = self.session.get(self.get_authenticate_url(), timeout=4)
                 # If the answer is ok, process data and change state
                 if r.ok:
                     self.auth_data = r.json()
@@ -405,23 +795,219 @@ class XTream:
                         "password": self.auth_data["user_info"]["password"]
                     }
                     self.state['authenticated'] = True
+                    # All stream URLs are built from this prefix -> Validated once instead of each stream URL.
+                    if not self._validate_url(self.get_url_prefix("live")):
+                        log(f"{self.name} - Bad server URL? `{self.server}`")
                 else:
                     log(f"Provider `{self.name}` could not be loaded. Reason: `{r.status_code} {r.reason}`")
             except requests.exceptions.ConnectionError:
                 # If connection refused
                 log(f"{self.name} - Connection refused URL: {self.server}")
 
-    def _load_from_file(self, filename) -> dict | None:
+    def _create_session(self) -> requests.Session:
+        """Create HTTP session with the connection pool and retries
+
+        Returns:
+            requests.Session: Session for all requests to the provider
+        """
+        retries = Retry(total=self.max_retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                        allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_fetch_workers, max_retries=retries)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _is_cached(self, filename, stale: bool = False) -> bool:
+        """Check if the file is cached and still fresh
+
+        Args:
+            filename ([type]): File name containing the data
+            stale (bool, optional): True to also accept files older than threshold_time_sec. Defaults to False.
+
+        Returns:
+            bool: True if the file can be loaded instead of downloading
+        """
+        full_filename = osp.join(self.cache_path, f"{self.slug}-{filename}")
+        if not osp.isfile(full_filename):
+            return False
+        return stale or self.threshold_time_sec > time.time() - osp.getmtime(full_filename)
+
+    def _get_download_jobs(self, stream_types) -> list:
+        """Get the cache files of the categories and streams with their URLs
+
+        Returns:
+            list: (file name, URL) pairs
+        """
+        jobs = []
+        for stream_type in stream_types:
+            jobs.append((f"all_groups_{stream_type}.json", self._get_categories_url(stream_type)))
+            # Lazy mode -> The streams are loaded by category.
+            if not self.lazy:
+                jobs.append((f"all_stream_{stream_type}.json", self._get_streams_url(stream_type)))
+        return jobs
+
+    def _start_downloads(self, stream_types, stale: bool = False) -> dict:
+        """Start concurrent downloads of the not cached categories and streams
+
+        Args:
+            stream_types ([type]): Stream types to load
+            stale (bool, optional): True if the stale files are used instead of downloading. Defaults to False.
+
+        Returns:
+            dict: File name -> Future with the download time
+        """
+        jobs = [j for j in self._get_download_jobs(stream_types) if not self._is_cached(j[0], stale)]
+        futures = run_on_daemon_threads(self._download_to_file, [(u, f) for f, u in jobs], self.max_fetch_workers)
+        return {f: future for (f, u), future in zip(jobs, futures)}
+
+    def _start_revalidation(self, stream_types, update_callback):
+        """Refresh the stale cache files in the background
+
+        If any file is refreshed, the data is reloaded and update_callback(self) is called
+        from the background thread.
+
+        Args:
+            stream_types ([type]): Loaded stream types
+            update_callback ([type]): Called after the data is reloaded
+        """
+        jobs = [j for j in self._get_download_jobs(stream_types) if not self._is_cached(j[0])]
+        if not jobs:
+            return
+
+        def revalidate():
+            wait(run_on_daemon_threads(self._download_to_file, [(u, f) for f, u in jobs], self.max_fetch_workers))
+
+            if any(self._is_cached(f) for f, u in jobs):
+                self.reload_iptv()
+                update_callback(self)
+            else:
+                log(f"{self.name} - Could not refresh the stale data")
+
+        log(f"{self.name} - Refreshing {len(jobs)} stale files in the background...")
+        Thread(target=revalidate, daemon=True).start()
+
+    def _get_download(self, downloads: dict, filename: str, url: str) -> float:
+        """Wait for the started download, or download now
+
+        Returns:
+            float: Download time
+        """
+        future = downloads.pop(filename, None)
+        return future.result() if future else self._download_to_file(url, filename)
+
+    def _download_to_file(self, url: str, filename: str, timeout: Tuple = (2, 15)) -> float:
+        """Download the JSON data directly to the cache file
+
+        The data is written in chunks as it arrives and decoded later from the file,
+        so the full response is never held in memory.
+
+        Args:
+            url (str): The URL where to GET content
+            filename (str): Name of the file
+            timeout (Tuple, optional): Connection and Downloading Timeout. Defaults to (2,15).
+
+        Returns:
+            float: Download time
+        """
+        full_filename = osp.join(self.cache_path, f"{self.slug}-{filename}")
+        action = self._get_action(url)
+        start = timer()
+        try:
+            with self.session.get(url, timeout=timeout, stream=True) as r:
+                if r.status_code == 200:
+                    with open(f"{full_filename}.part", mode="wb") as file:
+                        for data in r.iter_content(CHUNK_SIZE):
+                            file.write(data)
+                    replace(f"{full_filename}.part", full_filename)
+                log(f" - {action}: {r.status_code} in {timer() - start:.3f} seconds")
+        except (requests.exceptions.RequestException, OSError) as e:
+            log(f" - {action}: Download error: e=`{e}`")
+
+        return timer() - start
+
+    def _get_stream_cache(self, filename: str, fields: tuple) -> StreamCache | None:
+        """Open the binary cache of the stream list
+
+        The cache is built from the JSON file once and rebuilt when the JSON file is replaced
+        or the lean mode is changed.
+
+        Args:
+            filename (str): Name of the JSON file containing the streams
+            fields (tuple): Fields to store -> STREAM_FIELDS, SERIES_FIELDS
+
+        Returns:
+            StreamCache: Stream cache, None if the JSON file does not exist or the cache can't be built
+        """
+        full_filename = osp.join(self.cache_path, f"{self.slug}-{filename}")
+        if not osp.isfile(full_filename):
+            return None
+
+        base_filename = osp.splitext(full_filename)[0]
+        source = stat(full_filename)
+        # The views of the previous version can still be in use -> The new version is written to a new file.
+        raw = not self.lean
+        cache_filename = f"{base_filename}.{source.st_size}-{source.st_mtime_ns}{'-raw' if raw else ''}.bin"
+        try:
+            cache = StreamCache(cache_filename)
+        except (OSError, ValueError):
+            pass
+        else:
+            if (cache.source_size, cache.source_mtime, cache.has_raw) == (source.st_size, source.st_mtime_ns, raw):
+                return cache
+            cache.close()
+
+        try:
+            start = timer()
+            # Streams are decoded one by one from the file -> Huge lists are never held in memory.
+            count = StreamCache.write(cache_filename, self._iter_file(full_filename), fields,
+                                      source.st_size, source.st_mtime_ns, raw=raw)
+            log(f" - Cached {count} streams from `{filename}` in {timer() - start:.3f} seconds")
+            cache = StreamCache(cache_filename)
+        except (OSError, ValueError) as e:
+            log(f" - Could not cache the streams from `{filename}`: e=`{e}`")
+            return None
+
+        self._remove_stale_caches(base_filename, cache_filename)
+        return cache
+
+    @staticmethod
+    def _remove_stale_caches(base_filename: str, cache_filename: str):
+        """Remove the cache files of the previous versions of the stream list
+
+        Files that are still mapped can't be removed on Windows. They are removed with the next rebuild.
+
+        Args:
+            base_filename (str): Path of the JSON file without the extension
+            cache_filename (str): Path of the current cache file
+        """
+        for path in glob.glob(f"{glob.escape(base_filename)}.*bin"):
+            if path != cache_filename:
+                try:
+                    remove(path)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _iter_file(full_filename):
+        try:
+            with open(full_filename, mode='r', encoding='utf-8') as m_file:
+                yield from iter_json_array(m_file)
+        except ValueError as e:
+            log(f" - Could not load from file `{full_filename}`: e=`{e}`")
+
+    def _load_from_file(self, filename, stale: bool = False) -> dict | None:
         """Try to load the dictionary from file
 
         Args:
             filename ([type]): File name containing the data
+            stale (bool, optional): True to also load files older than threshold_time_sec. Defaults to False.
 
         Returns:
             dict: Dictionary if found and no errors, None if file does not exists
         """
         # Build the full path
-        full_filename = osp.join(self.cache_path, f"{self._slugify(self.name)}-{filename}")
+        full_filename = osp.join(self.cache_path, f"{self.slug}-{filename}")
 
         if osp.isfile(full_filename):
             my_data = None
@@ -430,7 +1016,7 @@ class XTream:
             # If the file was updated less than the threshold time,
             # it means that the file is still fresh, we can load it.
             # Otherwise skip and return None to force a re-download
-            if self.threshold_time_sec > diff_time:
+            if stale or self.threshold_time_sec > diff_time:
                 # Load the JSON data
                 try:
                     with open(full_filename, mode='r', encoding='utf-8') as m_file:
@@ -441,34 +1027,7 @@ class XTream:
                     log(f" - Could not load from file `{full_filename}`: e=`{e}`")
             return my_data
 
-    def _save_to_file(self, data_list: dict, filename: str) -> bool:
-        """Save a dictionary to file
-
-        This function will overwrite the file if already exists
-
-        Args:
-            data_list (dict): Dictionary to save
-            filename (str): Name of the file
-
-        Returns:
-            bool: True if successfull, False if error
-        """
-        if data_list:
-            # Build the full path
-            full_filename = osp.join(self.cache_path, f"{self._slugify(self.name)}-{filename}")
-            # If the path makes sense, save the file
-            json_data = json.dumps(data_list, ensure_ascii=False)
-            try:
-                with open(full_filename, mode='wt', encoding='utf-8') as myfile:
-                    myfile.write(json_data)
-            except Exception as e:
-                log(f" - Could not save to file `{full_filename}`: e=`{e}`")
-                return False
-
-            return True
-        return False
-
-    def load_iptv(self):
+    def load_iptv(self, update_callback=None, stage_callback=None):
         """Load XTream IPTV
 
         - Add all Live TV to XTream.channels
@@ -479,147 +1038,353 @@ class XTream:
         - Add all groups to XTream.groups
           Groups are for all three channel types, Live TV, VOD, and Series
 
+        Args:
+            update_callback (optional): Stale-while-revalidate mode. The stale cached files are loaded
+                                        without waiting for the provider and refreshed in the background.
+                                        Then the data is reloaded and update_callback(self) is called.
+                                        Defaults to None -> Stale files are downloaded before loading.
+            stage_callback (optional): Staged loading. Called as stage_callback(self, stream_type) when the streams
+                                       of each type are loaded [Live first], so they can be used before the rest
+                                       is loaded. Defaults to None.
         """
         # If pyxtream has already authenticated the connection and not loaded the data, start loading
         if self.state["authenticated"]:
             if not self.state["loaded"]:
-                for loading_stream_type in (self.live_type, self.vod_type, self.series_type):
+                stream_types = []
+                for loading_stream_type, content_type in zip((self.live_type, self.vod_type, self.series_type),
+                                                             CONTENT_TYPES):
+                    if self.content_filter.accept_type(content_type):
+                        stream_types.append((loading_stream_type, content_type))
+                    else:
+                        log(f" - Skipped {loading_stream_type} content [filter]")
+
+                start = timer()
+                stale = update_callback is not None
+                downloads = self._start_downloads((t for t, c in stream_types), stale)
+
+                for loading_stream_type, content_type in stream_types:
                     # Get GROUPS
                     # Try loading local file
                     dt = 0
-                    all_cat = self._load_from_file("all_groups_{}.json".format(loading_stream_type))
+                    filename = "all_groups_{}.json".format(loading_stream_type)
                     # If file empty or does not exists, download it from remote
-                    if all_cat is None:
-                        # Load all Groups and save file locally
-                        start = timer()
-                        all_cat = self._load_categories_from_provider(loading_stream_type)
-                        self._save_to_file(all_cat, "all_groups_{}.json".format(loading_stream_type))
-                        dt = timer() - start
+                    if filename in downloads or not self._is_cached(filename, stale):
+                        dt = self._get_download(downloads, filename, self._get_categories_url(loading_stream_type))
+                    all_cat = self._load_from_file(filename, stale)
 
                     # If we got the GROUPS data, show the statistics and load GROUPS
                     if all_cat:
                         log(f"Loaded {len(all_cat)} {loading_stream_type} Groups in {dt:.3f} seconds")
-                        # Add GROUPS to dictionaries
-                        # Add the catch-all-errors group
-                        self.groups.append(self.catch_all_group)
-
+                        # Category ID -> Group. Built once per stream type for O(1) lookup of the streams group.
+                        # Category IDs are only unique within the stream type.
+                        categories = {}
+                        # Category IDs rejected by the content filter.
+                        skipped_categories = set()
                         for cat_obj in all_cat:
+                            if not self.content_filter.accept_category(cat_obj["category_name"], content_type):
+                                skipped_categories.add(str(cat_obj.get("category_id")))
+                                continue
                             # Create Group (Category)
                             new_group = Group(cat_obj, loading_stream_type)
+                            categories.setdefault(new_group.group_id, new_group)
                             #  Add to xtream class
                             self.groups.append(new_group)
 
-                        # Add the catch-all-errors group
-                        grp = Group({"category_id": "9999", "category_name": "xEverythingElse", "parent_id": 0})
-                        self.groups.append(grp, loading_stream_type)
-                        # Sort Categories
-                        self.groups.sort(key=lambda x: x.name)
+                        # The catch-all-errors group -> Streams without a known category.
+                        catch_all_group = Group({"category_id": "9999", "category_name": "xEverythingElse",
+                                                 "parent_id": 0}, loading_stream_type)
                     else:
                         log(f" - Could not load {loading_stream_type} Groups")
                         break
 
+                    if self.lazy:
+                        # The streams are loaded when the category is opened -> load_category.
+                        self.state['loaded'] = True
+                        self.groups.sort(key=lambda x: x.name)
+                        if stage_callback:
+                            stage_callback(self, loading_stream_type)
+                        continue
+
                     # Get Streams
 
                     # Try loading local file
                     dt = 0
-                    all_streams = self._load_from_file(f"all_stream_{loading_stream_type}.json")
+                    filename = f"all_stream_{loading_stream_type}.json"
                     # If file empty or does not exists, download it from remote
-                    if all_streams is None:
-                        # Load all Streams and save file locally
-                        start = timer()
-                        all_streams = self._load_streams_from_provider(loading_stream_type)
-                        self._save_to_file(all_streams, f"all_stream_{loading_stream_type}.json")
-                        dt = timer() - start
-
-                    # If we got the STREAMS data, show the statistics and load Streams
-                    if all_streams:
-                        log(f"Loaded {len(all_streams)} {loading_stream_type} Streams in {dt:.3f} seconds")
-                        # Add Streams to dictionaries
-                        skipped_adult_content = 0
-                        skipped_no_name_content = 0
-
-                        for stream_channel in all_streams:
-                            skip_stream = False
-                            # Skip if the name of the stream is empty
-                            if not stream_channel["name"]:
-                                skip_stream = True
-                                skipped_no_name_content = skipped_no_name_content + 1
-                                self._save_to_file_skipped_streams(stream_channel)
-
-                            # Skip if the user chose to hide adult streams
-                            if self.hide_adult_content and loading_stream_type == self.live_type:
-                                try:
-                                    if stream_channel["is_adult"] == "1":
-                                        skip_stream = True
-                                        skipped_adult_content = skipped_adult_content + 1
-                                        self._save_to_file_skipped_streams(stream_channel)
-                                except Exception:
-                                    log(f" - Stream does not have `is_adult` key:\n\t`{json.dumps(stream_channel)}`")
-                                    pass
-
-                            if not skip_stream:
-                                # Some channels have no group,
-                                # so let's add them to the catch all group
-                                if not stream_channel["category_id"]:
-                                    stream_channel["category_id"] = "9999"
-                                # Find the first occurence of the group that the
-                                # Channel or Stream is pointing to
-                                the_group = next(
-                                    (x for x in self.groups if x.group_id == int(stream_channel['category_id'])), None)
-                                # Set group title
-                                if the_group:
-                                    group_title = the_group.name
-                                else:
-                                    group_title = self.catch_all_group.name
-                                    the_group = self.catch_all_group
-
-                                if loading_stream_type == self.series_type:
-                                    # Load all Series
-                                    new_series = Serie(self, stream_channel)
-                                    # To get all the Episodes for every Season of each
-                                    # Series is very time consuming, we will only
-                                    # populate the Series once the user click on the
-                                    # Series, the Seasons and Episodes will be loaded
-                                    # using x.getSeriesInfoByID() function
-                                else:
-                                    new_channel = Channel(self, group_title, stream_channel)
-
-                                if new_channel.group_id == '9999':
-                                    log(" - xEverythingElse Channel -> {} - {}".format(new_channel.name,
-                                                                                       new_channel.stream_type))
-                                # Save the new channel to the local list of channels
-                                if loading_stream_type == self.live_type:
-                                    self.channels.append(new_channel)
-                                elif loading_stream_type == self.vod_type:
-                                    self.movies.append(new_channel)
-                                else:
-                                    self.series.append(new_series)
-
-                                # Add stream to the specific Group
-                                if the_group:
-                                    if loading_stream_type != self.series_type:
-                                        the_group.channels.append(new_channel)
-                                    else:
-                                        the_group.series.append(new_series)
-                                else:
-                                    log(f" - Group not found `{stream_channel['name']}`")
-
+                    if filename in downloads or not self._is_cached(filename, stale):
+                        dt = self._get_download(downloads, filename, self._get_streams_url(loading_stream_type))
+                    fields = SERIES_FIELDS if loading_stream_type == self.series_type else STREAM_FIELDS
+                    cache = self._get_stream_cache(filename, fields)
+
+                    # If we got the STREAMS data, load Streams and show the statistics
+                    if cache is not None:
+                        def get_group(category_id):
+                            # Skip (before any processing) if the category is filtered out
+                            if category_id in skipped_categories:
+                                return None
+                            # Some channels have no group, so let's add them to the catch all group.
+                            group = categories.get(int(category_id)) if category_id.isdecimal() else None
+                            return group or catch_all_group
+
+                        stats = self._add_streams(cache, loading_stream_type, get_group)
+                        loaded_streams, skipped_adult_content, skipped_no_name_content, skipped_filtered_content = stats
+                        log(f"Loaded {loaded_streams} {loading_stream_type} Streams in {dt:.3f} seconds")
                         # log information of which streams have been skipped
                         if self.hide_adult_content:
                             log(f" - Skipped {skipped_adult_content} adult {loading_stream_type} streams")
+                        if skipped_filtered_content > 0:
+                            log(f" - Skipped {skipped_filtered_content} filtered {loading_stream_type} streams")
                         if skipped_no_name_content > 0:
                             log(f" - Skipped {skipped_no_name_content} unlogable {loading_stream_type} streams")
+                        if catch_all_group.channels or catch_all_group.series:
+                            num = len(catch_all_group.channels) + len(catch_all_group.series)
+                            log(f" - {num} {loading_stream_type} streams without a known group -> xEverythingElse")
+                            self.groups.append(catch_all_group)
                     else:
                         log(f" - Could not load {loading_stream_type} Streams")
 
                     self.state['loaded'] = True
-
+                    # Sort Categories. The loaded part is complete after each stream type.
+                    self.groups.sort(key=lambda x: x.name)
+                    if stage_callback:
+                        stage_callback(self, loading_stream_type)
+
+                log(f"{self.name} - Loaded in {timer() - start:.3f} seconds")
+                if stale:
+                    self._start_revalidation((t for t, c in stream_types), update_callback)
             else:
                 log("Warning, data has already been loaded.")
         else:
             log("Warning, cannot load steams since authorization failed")
 
-    def _save_to_file_skipped_streams(self, stream_channel: Channel):
+    def _add_streams(self, cache: StreamCache, loading_stream_type: str, get_group) -> Tuple:
+        """Add the streams of the cache to the lists and groups
+
+        Args:
+            cache (StreamCache): Stream cache
+            loading_stream_type (str): Stream type -> Live, VOD, Series
+            get_group: Returns the group of the stream by its category ID, None if the category is filtered out
+
+        Returns:
+            Tuple: Numbers of the loaded, skipped adult, skipped unnamed and skipped filtered streams
+        """
+        loaded_streams = 0
+        skipped_adult_content = 0
+        skipped_no_name_content = 0
+        skipped_filtered_content = 0
+        fields = SERIES_FIELDS if loading_stream_type == self.series_type else STREAM_FIELDS
+        # Stream type -> URL prefix
+        url_prefixes = {}
+
+        for index, record in enumerate(cache.iter_records()):
+            loaded_streams += 1
+            # Find the group that the Channel or Stream is pointing to
+            the_group = get_group(cache.get_string(record, CATEGORY_ID))
+            if the_group is None:
+                skipped_filtered_content += 1
+                continue
+
+            # Skip if the name of the stream is empty
+            if not record[NAME * 2 + 1]:
+                skipped_no_name_content = skipped_no_name_content + 1
+                self._save_to_file_skipped_streams(cache.get_raw(index, fields))
+                continue
+
+            # Skip if the user chose to hide adult streams
+            if self.hide_adult_content and loading_stream_type == self.live_type and record[-1]:
+                skipped_adult_content = skipped_adult_content + 1
+                self._save_to_file_skipped_streams(cache.get_raw(index, fields))
+                continue
+
+            if loading_stream_type == self.series_type:
+                # Load all Series
+                new_series = Serie(self, cache, index)
+                # To get all the Episodes for every Season of each
+                # Series is very time consuming, we will only
+                # populate the Series once the user click on the
+                # Series, the Seasons and Episodes will be loaded
+                # using x.getSeriesInfoByID() function
+                self.series.append(new_series)
+                the_group.series.append(new_series)
+                continue
+
+            stream_type = cache.get_string(record, STREAM_TYPE)
+            url_prefix = url_prefixes.get(stream_type)
+            if url_prefix is None:
+                if stream_type not in ("live", "created_live", "radio_streams", "movie"):
+                    log(f"Error the channel has unknown stream type `{stream_type}`")
+                    continue
+                url_prefix = url_prefixes[stream_type] = self.get_url_prefix(stream_type)
+
+            new_channel = Channel(self, the_group.name, cache, index, url_prefix)
+            # Save the new channel to the local list of channels
+            if loading_stream_type == self.live_type:
+                self.channels.append(new_channel)
+            else:
+                self.movies.append(new_channel)
+            # Add stream to the specific Group
+            the_group.channels.append(new_channel)
+
+        return loaded_streams, skipped_adult_content, skipped_no_name_content, skipped_filtered_content
+
+    def reload_iptv(self):
+        """Reload XTream IPTV from the refreshed cache files
+
+        The current lists are replaced, not modified.
+        The pending prefetches are cancelled, and the categories being loaded are awaited first.
+        """
+        with self._category_lock:
+            self._prefetch_queue = []
+            self._prefetch_done.wait_for(lambda: not self._prefetch_workers)
+            loads = list(self._category_loads.values())
+        wait(loads)
+
+        self.groups = []
+        self.channels = []
+        self.series = []
+        self.movies = []
+        self.state['loaded'] = False
+        with self._category_lock:
+            self._category_loads = {}
+        self.load_iptv()
+
+    def is_category_loaded(self, group: Group) -> bool:
+        """Check if the streams of the category are loaded [lazy mode]
+
+        Args:
+            group (Group): Category
+
+        Returns:
+            bool: True if the streams are loaded or the lazy mode is off
+        """
+        future = self._category_loads.get(self._get_category_key(group))
+        return not self.lazy or (future is not None and future.done() and future.result())
+
+    @staticmethod
+    def _get_category_key(group: Group) -> tuple:
+        return group.group_type, group.group_id
+
+    def get_group(self, group: Group) -> Group | None:
+        """Get the current group of the category
+
+        The published groups are never modified. When the streams of the category are loaded
+        [lazy mode], the group is replaced with a new one.
+
+        Args:
+            group (Group): Any group of the category [e.g. from the previously published data]
+
+        Returns:
+            Group: Current group of the category, None if there is no such category
+        """
+        key = self._get_category_key(group)
+        return next((g for g in self.groups if self._get_category_key(g) == key), None)
+
+    def load_category(self, group: Group) -> bool:
+        """Load the streams of the category [lazy mode]
+
+        The streams are downloaded with the category filter of the API and cached like the full lists.
+        Each category is loaded once. If it is already being loaded [prefetch], the call waits for it.
+        The loaded streams are in the new group of the category -> get_group.
+
+        Args:
+            group (Group): Category
+
+        Returns:
+            bool: True if the streams are loaded
+        """
+        if self.is_category_loaded(group):
+            return True
+
+        key = self._get_category_key(group)
+        with self._category_lock:
+            future = self._category_loads.get(key)
+            owner = future is None
+            if owner:
+                future = self._category_loads[key] = Future()
+
+        if owner:
+            try:
+                loaded = self._load_category(group)
+            except Exception as e:
+                log(f" - Could not load the category `{group.name}`: e=`{e}`")
+                loaded = False
+            if not loaded:
+                # Can be retried on the next opening.
+                with self._category_lock:
+                    self._category_loads.pop(key, None)
+            future.set_result(loaded)
+
+        return future.result()
+
+    def prefetch_neighbours(self, group: Group):
+        """Load the neighbouring categories of the same type in the background [lazy mode]
+
+        Args:
+            group (Group): Opened category
+        """
+        if not self.lazy:
+            return
+
+        groups = [g for g in self.groups if g.group_type == group.group_type]
+        key = self._get_category_key(group)
+        index = next((i for i, g in enumerate(groups) if self._get_category_key(g) == key), None)
+        if index is None:
+            return
+
+        start = max(0, index - self.prefetch_distance)
+        neighbours = groups[start:index] + groups[index + 1:index + 1 + self.prefetch_distance]
+
+        with self._category_lock:
+            # The neighbours of the previously opened category are no longer needed.
+            self._prefetch_queue = [g for g in neighbours if self._get_category_key(g) not in self._category_loads]
+            count = min(len(self._prefetch_queue), self.max_prefetch_workers - self._prefetch_workers)
+            self._prefetch_workers += count
+        # Daemon threads -> The application exit doesn't wait for the downloads.
+        for __ in range(count):
+            Thread(target=self._prefetch, daemon=True).start()
+
+    def _prefetch(self):
+        while True:
+            with self._category_lock:
+                if not self._prefetch_queue:
+                    self._prefetch_workers -= 1
+                    self._prefetch_done.notify_all()
+                    return
+                group = self._prefetch_queue.pop(0)
+            try:
+                self.load_category(group)
+            except Exception as e:
+                log(f" - Could not prefetch the category `{group.name}`: e=`{e}`")
+
+    def _load_category(self, group: Group) -> bool:
+        start = timer()
+        group = self.get_group(group)
+        if group is None:
+            return False
+
+        loading_stream_type = (self.live_type, self.vod_type, self.series_type)[group.group_type]
+        filename = f"stream_{loading_stream_type}_{group.group_id}.json"
+        if not self._is_cached(filename):
+            self._download_to_file(self._get_streams_url_by_category(loading_stream_type, group.group_id), filename)
+            # The stale file is used if the download fails.
+            if not self._is_cached(filename, stale=True):
+                return False
+
+        fields = SERIES_FIELDS if loading_stream_type == self.series_type else STREAM_FIELDS
+        cache = self._get_stream_cache(filename, fields)
+        if cache is None:
+            return False
+
+        # The published group may be in use -> The streams are added to a copy, which replaces the group.
+        new_group = copy(group)
+        new_group.channels, new_group.series = list(group.channels), list(group.series)
+        loaded_streams = self._add_streams(cache, loading_stream_type, lambda c: new_group)[0]
+        with self._category_lock:
+            self.groups[self.groups.index(group)] = new_group
+        log(f"Loaded {loaded_streams} {loading_stream_type} Streams of `{group.name}` in {timer() - start:.3f} seconds")
+        return True
+
+    def _save_to_file_skipped_streams(self, stream_channel: dict):
         # Build the full path
         full_filename = osp.join(self.cache_path, "skipped_streams.json")
         # If the path makes sense, save the file
@@ -649,6 +1414,11 @@ class XTream:
                         new_episode_channel = Episode(self, series_info, "Testing", episode_info)
                         season.episodes[episode_info['title']] = new_episode_channel
 
+    @staticmethod
+    def _get_action(url: str) -> str:
+        """Get the API action of the URL for logging. Credentials are not logged."""
+        return parse_qs(urlsplit(url).query).get("action", [urlsplit(url).path])[0]
+
     def _get_request(self, url: str, timeout: Tuple = (2, 15)):
         """Generic GET Request with Error handling
 
@@ -659,8 +1429,11 @@ class XTream:
         Returns:
             [type]: JSON dictionary of the loaded data, or None
         """
+        action = self._get_action(url)
+        start = timer()
         try:
-            r = requests.get(url, timeout=timeout)
+            r = self.session.get(url, timeout=timeout)
+            log(f" - {action}: {r.status_code} in {timer() - start:.3f} seconds")
             if r.status_code == 200:
                 return r.json()
 
@@ -670,19 +1443,13 @@ class XTream:
             log(" - HTTP Error")
         except requests.exceptions.TooManyRedirects:
             log(" - TooManyRedirects")
+        except requests.exceptions.RetryError:
+            log(" - Too many retries")
         except requests.exceptions.ReadTimeout as e:
             log(" - Timeout while loading data")
 
     # GET Stream Categories
-    def _load_categories_from_provider(self, stream_type: str):
-        """Get from provider all category for specific stream type from provider
-
-        Args:
-            stream_type (str): Stream type can be Live, VOD, Series
-
-        Returns:
-            [type]: JSON if successfull, otherwise None
-        """
+    def _get_categories_url(self, stream_type: str) -> str:
         url = ""
         if stream_type == self.live_type:
             url = self.get_live_categories_url()
@@ -690,12 +1457,10 @@ class XTream:
             url = self.get_vod_cat_url()
         elif stream_type == self.series_type:
             url = self.get_series_cat_url()
+        return url
 
-        return self._get_request(url)
-
-    # GET Streams
-    def _load_streams_from_provider(self, stream_type: str):
-        """Get from provider all streams for specific stream type
+    def _load_categories_from_provider(self, stream_type: str):
+        """Get from provider all category for specific stream type from provider
 
         Args:
             stream_type (str): Stream type can be Live, VOD, Series
@@ -703,6 +1468,10 @@ class XTream:
         Returns:
             [type]: JSON if successfull, otherwise None
         """
+        return self._get_request(self._get_categories_url(stream_type))
+
+    # GET Streams
+    def _get_streams_url(self, stream_type: str) -> str:
         url = ""
         if stream_type == self.live_type:
             url = self.get_live_streams_url()
@@ -710,20 +1479,21 @@ class XTream:
             url = self.get_vod_streams_url()
         elif stream_type == self.series_type:
             url = self.get_series_url()
+        return url
 
-        return self._get_request(url)
-
-    # GET Streams by Category
-    def _load_streams_by_category_from_provider(self, stream_type: str, category_id):
-        """Get from provider all streams for specific stream type with category/group ID
+    def _load_streams_from_provider(self, stream_type: str):
+        """Get from provider all streams for specific stream type
 
         Args:
             stream_type (str): Stream type can be Live, VOD, Series
-            category_id ([type]): Category/Group ID.
 
         Returns:
             [type]: JSON if successfull, otherwise None
         """
+        return self._get_request(self._get_streams_url(stream_type))
+
+    # GET Streams by Category
+    def _get_streams_url_by_category(self, stream_type: str, category_id) -> str:
         url = ""
         if stream_type == self.live_type:
             url = self.get_live_streams_url_by_category(category_id)
@@ -731,8 +1501,19 @@ class XTream:
             url = self.get_vod_streams_url_by_category(category_id)
         elif stream_type == self.series_type:
             url = self.get_series_url_by_category(category_id)
+        return url
 
-        return self._get_request(url)
+    def _load_streams_by_category_from_provider(self, stream_type: str, category_id):
+        """Get from provider all streams for specific stream type with category/group ID
+
+        Args:
+            stream_type (str): Stream type can be Live, VOD, Series
+            category_id ([type]): Category/Group ID.
+
+        Returns:
+            [type]: JSON if successfull, otherwise None
+        """
+        return self._get_request(self._get_streams_url_by_category(stream_type, category_id))
 
     # GET SERIES Info
     def _load_series_info_by_id_from_provider(self, series_id: str):
@@ -837,5 +1618,43 @@ class XTream:
         return '%s/xmltv.php?username=%s&password=%s' % (self.server, self.username, self.password)
 
 
+def benchmark(groups_path: str, streams_path: str, repeat: int = 3):
+    """Compare the category lookup of streams: linear scan vs index
+
+    Uses a recorded provider response, e.g. the cached files:
+        python3 -m app.xtream ~/.cache/tvdemon/providers/<name>-all_groups_VOD.json \\
+                              ~/.cache/tvdemon/providers/<name>-all_stream_VOD.json
+
+    Args:
+        groups_path (str): Path of the categories JSON file
+        streams_path (str): Path of the streams JSON file
+        repeat (int, optional): Number of repetitions. Defaults to 3.
+    """
+    from timeit import timeit
+
+    with open(groups_path, mode='r', encoding='utf-8') as file:
+        groups = [Group(c, "VOD") for c in json.load(file)]
+    with open(streams_path, mode='r', encoding='utf-8') as file:
+        ids = [int(s['category_id'] or 9999) for s in json.load(file)]
+
+    def scan():
+        return [next((x for x in groups if x.group_id == i), None) for i in ids]
+
+    def index():
+        categories = {}
+        [categories.setdefault(g.group_id, g) for g in groups]
+        return [categories.get(i) for i in ids]
+
+    assert scan() == index()
+    scan_time = min(timeit(scan, number=1) for _ in range(repeat))
+    index_time = min(timeit(index, number=1) for _ in range(repeat))
+
+    print(f"Groups: {len(groups)}, streams: {len(ids)}")
+    print(f"Scan: {scan_time:.3f} s, index: {index_time:.3f} s, speedup: {scan_time / index_time:.0f}x")
+
+
 if __name__ == '__main__':
-    pass
+    import sys
+
+    if len(sys.argv) > 2:
+        benchmark(sys.argv[1], sys.argv[2])